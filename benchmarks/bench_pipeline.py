@@ -0,0 +1,216 @@
+"""End-to-end throughput benchmark of the translation pipeline against the mock server.
+
+    python -m benchmarks.bench_pipeline --documents 20 --latency 0.2 --json out.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from translatorrr import BatchRunner, Translator
+from translatorrr.llm import LLM, LLMSettings
+from translatorrr.translator import TranslationCache, TranslatorSettings
+
+from .corpus import generate_document, write_corpus
+from .mock_server import (
+    MockOpenAIServer,
+    MockSettings,
+    RequestRecord,
+    estimate_tokens,
+)
+
+STAGES = ("basic", "reflect", "improve")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def build_translator(server: MockOpenAIServer, workdir: str, args) -> Translator:
+    llm_settings = LLMSettings(
+        _env_file=None,
+        gemini_api_keys=",".join(f"mock-key-{i}" for i in range(args.keys)),
+        gemini_base_url=server.base_url,
+        openai_base_url=server.base_url,
+        mission_model="gemini-1.5-flash-002",
+        max_concurrency=args.concurrency,
+        stream=not args.no_stream,
+    )
+    settings = TranslatorSettings(
+        _env_file=None,
+        output_folder=os.path.join(workdir, "output"),
+        memory_path="",
+        show_progress=False,
+        pipeline_mode=args.pipeline_mode,
+        micro_batch=args.micro_batch,
+        context_mode=args.context_mode,
+        context_tokens=args.context_tokens,
+    )
+    return Translator(
+        settings=settings,
+        llm=LLM(settings=llm_settings),
+        cacher=TranslationCache(os.path.join(workdir, "cache")),
+    )
+
+
+def summarize(
+    name: str,
+    documents: int,
+    source_tokens: int,
+    elapsed: float,
+    records: List[RequestRecord],
+) -> Dict:
+    ok = [r for r in records if r.status == 200]
+    prompt_tokens = sum(r.prompt_tokens for r in ok)
+    cached_tokens = sum(r.cached_tokens for r in ok)
+    result = {
+        "scenario": name,
+        "documents": documents,
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_min": round(documents / elapsed * 60, 2) if elapsed else 0.0,
+        "llm_calls": len(ok),
+        "rejected_calls": len(records) - len(ok),
+        "prompt_tokens_per_source_token": (
+            round(prompt_tokens / source_tokens, 2) if source_tokens else 0.0
+        ),
+        "cached_prompt_share": (
+            round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+        ),
+        "stages": {},
+    }
+    for stage in STAGES:
+        latencies = [r.latency for r in ok if r.stage == stage]
+        result["stages"][stage] = {
+            "calls": len(latencies),
+            "p50_s": round(percentile(latencies, 50), 3),
+            "p95_s": round(percentile(latencies, 95), 3),
+        }
+    return result
+
+
+def bench_translate(server: MockOpenAIServer, args) -> Dict:
+    server.reset()
+    texts = [generate_document(seed, args.sections) for seed in range(args.documents)]
+    with tempfile.TemporaryDirectory() as workdir:
+        translator = build_translator(server, workdir, args)
+        start = time.perf_counter()
+        for i, text in enumerate(texts):
+            cacher = translator.cacher.namespace(f"document-{i}")
+            translator.llm.run(translator.atranslate(text, cacher))
+        elapsed = time.perf_counter() - start
+    source_tokens = sum(estimate_tokens(text) for text in texts)
+    result = summarize("translate", len(texts), source_tokens, elapsed, server.records)
+    result.update(translator.policy.summary())
+    return result
+
+
+def bench_translate_file(server: MockOpenAIServer, args) -> Dict:
+    server.reset()
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = write_corpus(
+            os.path.join(workdir, "input"), args.documents, args.sections
+        )
+        source_tokens = 0
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                source_tokens += estimate_tokens(f.read())
+
+        translator = build_translator(server, workdir, args)
+        runner = BatchRunner(translator, max_documents=args.parallel_documents)
+        start = time.perf_counter()
+        report = runner.run(paths)
+        elapsed = time.perf_counter() - start
+    result = summarize(
+        "translate_file", len(paths), source_tokens, elapsed, server.records
+    )
+    result["failures"] = len(report.failures)
+    result.update(translator.policy.summary())
+    return result
+
+
+def format_result(result: Dict) -> str:
+    lines = [
+        f"[{result['scenario']}/{result['mode']}] {result['documents']} docs"
+        f" in {result['elapsed_s']}s -> {result['docs_per_min']} docs/min",
+        f"  llm calls: {result['llm_calls']} (rejected {result['rejected_calls']}),"
+        f" prompt tokens per source token: {result['prompt_tokens_per_source_token']}",
+        f"  prompt tokens served from the prefix cache:"
+        f" {result['cached_prompt_share']:.0%}",
+        f"  stage calls saved against full: {result['calls_saved']}"
+        f" ({result['saved_ratio']:.0%})",
+    ]
+    for stage, stats in result["stages"].items():
+        lines.append(
+            f"  {stage:<8} calls={stats['calls']:<5}"
+            f" p50={stats['p50_s']}s p95={stats['p95_s']}s"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--parallel-documents", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--rpm-per-key", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--micro-batch", action="store_true")
+    parser.add_argument(
+        "--context-mode", choices=["full", "window", "summary"], default="window"
+    )
+    parser.add_argument("--context-tokens", type=int, default=600)
+    parser.add_argument(
+        "--pipeline-mode",
+        choices=["fast", "full", "adaptive", "all"],
+        default="full",
+        help="'all' runs every scenario once per mode",
+    )
+    parser.add_argument(
+        "--scenario", choices=["translate", "translate_file", "all"], default="all"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    mock_settings = MockSettings(
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        rpm_per_key=args.rpm_per_key,
+        error_rate=args.error_rate,
+        seed=0,
+    )
+    modes = ["fast", "full", "adaptive"]
+    if args.pipeline_mode != "all":
+        modes = [args.pipeline_mode]
+    results = []
+    with MockOpenAIServer(mock_settings) as server:
+        for mode in modes:
+            mode_args = argparse.Namespace(**{**vars(args), "pipeline_mode": mode})
+            if args.scenario in ("translate", "all"):
+                results.append(bench_translate(server, mode_args))
+            if args.scenario in ("translate_file", "all"):
+                results.append(bench_translate_file(server, mode_args))
+
+    for result in results:
+        print(format_result(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
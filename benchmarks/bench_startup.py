@@ -0,0 +1,122 @@
+"""Startup latency of the package and the CLI, each measured in fresh interpreters.
+
+    python -m benchmarks.bench_startup --repeat 10 --max-import-ms 300 --json out.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# settings the translator needs to be constructed, no request is ever sent
+DUMMY_ENV = {
+    "GEMINI_API_KEYS": "bench",
+    "GEMINI_BASE_URL": "http://127.0.0.1:9/v1",
+    "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+    "MISSION_MODEL": "gemini-1.5-flash-002",
+}
+
+SCENARIOS: Dict[str, List[str]] = {
+    "import translatorrr": ["-c", "import translatorrr"],
+    "import Translator": ["-c", "from translatorrr import Translator"],
+    "Translator()": ["-c", "from translatorrr import Translator; Translator()"],
+    "cli --help": ["-m", "translatorrr", "--help"],
+    "cli status": ["-m", "translatorrr", "status", "--jobs", "missing.db"],
+}
+
+
+def run_once(args: List[str], workdir: str) -> float:
+    env = {**os.environ, **DUMMY_ENV, "PYTHONPATH": ROOT}
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def slowest_imports(statement: str, workdir: str, top: int) -> List[Tuple[str, float]]:
+    """Modules with the highest cumulative import time, from ``-X importtime``."""
+    env = {**os.environ, **DUMMY_ENV, "PYTHONPATH": ROOT}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # top-level entries only, their nested imports are part of them
+        if not name.startswith("  "):
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda module: -module[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=0,
+        help="exit with an error when `import translatorrr` is slower",
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, command in SCENARIOS.items():
+            run_once(command, workdir)  # warm the bytecode and file caches
+            times = [run_once(command, workdir) * 1000 for _ in range(args.repeat)]
+            results[name] = {
+                "median_ms": statistics.median(times),
+                "min_ms": min(times),
+                "max_ms": max(times),
+            }
+            print(
+                f"{name:<22} median {results[name]['median_ms']:8.1f} ms"
+                f"  min {results[name]['min_ms']:8.1f} ms"
+            )
+        # constructing a translator must not touch the disk
+        created = sorted(os.listdir(workdir))
+
+        imports = slowest_imports(
+            "from translatorrr import Translator; Translator()", workdir, args.top
+        )
+
+    print(f"files created by startup: {created or 'none'}")
+    print("slowest imports for Translator():")
+    for module, ms in imports:
+        print(f"  {module:<40} {ms:8.1f} ms")
+
+    output = {"scenarios": results, "created": created, "imports": dict(imports)}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+
+    import_ms = results["import translatorrr"]["median_ms"]
+    if args.max_import_ms and import_ms > args.max_import_ms:
+        raise SystemExit(
+            f"import translatorrr took {import_ms:.1f} ms,"
+            f" above the {args.max_import_ms:.0f} ms budget"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Synthetic markdown documents shaped like the papers and docs we translate."""
+
+import argparse
+import os
+import random
+from typing import List
+
+WORDS = (
+    "model training data latency throughput token layer attention gradient "
+    "result method network system paper approach baseline memory cache "
+    "request response sequence batch error signal value function analysis"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(8, 24))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def _block(rng: random.Random, idx: int) -> str:
+    kind = rng.choices(
+        ["paragraph", "list", "code", "math", "image", "table", "link"],
+        weights=[10, 2, 2, 2, 1, 1, 1],
+    )[0]
+    if kind == "list":
+        return "\n".join(f"- {_sentence(rng)}" for _ in range(rng.randint(2, 6)))
+    if kind == "code":
+        lines = [f"x_{i} = compute({i}, step={idx})" for i in range(rng.randint(3, 15))]
+        return "```python\n" + "\n".join(lines) + "\n```"
+    if kind == "math":
+        return f"$$\n\\mathcal{{L}}_{idx} = \\sum_i \\log p(y_i \\mid x_i)\n$$"
+    if kind == "image":
+        return f"![Figure {idx}](images/figure_{idx}.png)"
+    if kind == "table":
+        rows = [f"| {i} | {rng.random():.3f} | {rng.random():.3f} |" for i in range(5)]
+        return "| run | loss | acc |\n| --- | --- | --- |\n" + "\n".join(rows)
+    if kind == "link":
+        return f"{_sentence(rng)} See [the reference](https://example.com/ref/{idx})."
+    return _paragraph(rng)
+
+
+def generate_document(seed: int, sections: int = 8, blocks_per_section: int = 6) -> str:
+    rng = random.Random(seed)
+    parts = [f"# Synthetic Document {seed}"]
+    for section in range(sections):
+        parts.append(f"## Section {section + 1}")
+        for idx in range(rng.randint(1, blocks_per_section)):
+            parts.append(_block(rng, section * 100 + idx))
+    return "\n\n".join(parts) + "\n"
+
+
+def write_corpus(
+    folder: str, documents: int, sections: int = 8, seed: int = 0
+) -> List[str]:
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(folder, f"doc_{i:04d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_document(seed + i, sections=sections))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("folder")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = write_corpus(args.folder, args.documents, args.sections, args.seed)
+    print(f"wrote {len(paths)} documents to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
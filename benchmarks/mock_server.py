@@ -0,0 +1,310 @@
+"""OpenAI-compatible stand-in for benchmarking the pipeline without API credits.
+
+Run it standalone with ``python -m benchmarks.mock_server --port 8000`` and
+point ``GEMINI_BASE_URL``/``OPENAI_BASE_URL`` at ``http://127.0.0.1:8000/v1``.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+
+TRANSLATE_THIS = re.compile(r"<TRANSLATE_THIS>\n\s*(.*?)\n\s*</TRANSLATE_THIS>", re.S)
+PART = re.compile(r"<PART (\d+)>\n(.*?)\n</PART \1>", re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def classify_stage(prompt: str) -> str:
+    if "<EXPERT_SUGGESTIONS>" in prompt:
+        return "improve"
+    if "constructive criticism" in prompt:
+        return "reflect"
+    if "<TRANSLATE_THIS>" in prompt or "<PART 1>" in prompt:
+        return "basic"
+    return "other"
+
+
+@dataclass
+class MockSettings:
+    # time before the first token, lognormal around latency with spread sigma
+    latency: float = 0.3
+    latency_sigma: float = 0.5
+    # generation speed once tokens start flowing
+    tokens_per_second: float = 200.0
+    # per-key requests per minute before answering 429, 0 disables
+    rpm_per_key: int = 0
+    error_rate: float = 0.0
+    # serve repeated system prompts from a simulated prefix cache, which also
+    # shortens the time to first token by up to half
+    prefix_cache: bool = True
+    seed: Optional[int] = None
+
+
+@dataclass
+class RequestRecord:
+    stage: str
+    key: str
+    status: int
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    cached_tokens: int = 0
+
+
+@dataclass
+class MockOpenAIServer:
+    settings: MockSettings = field(default_factory=MockSettings)
+    host: str = "127.0.0.1"
+    port: int = 0
+    records: List[RequestRecord] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._random = random.Random(self.settings.seed)
+        self._windows: Dict[str, List[float]] = {}
+        self._prefixes: Set[str] = set()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+            self._windows.clear()
+            self._prefixes.clear()
+
+    def _rate_limited(self, key: str) -> bool:
+        if not self.settings.rpm_per_key:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = [t for t in self._windows.get(key, []) if now - t < 60]
+            limited = len(window) >= self.settings.rpm_per_key
+            if not limited:
+                window.append(now)
+            self._windows[key] = window
+        return limited
+
+    def _cached_tokens(self, messages: List[dict]) -> int:
+        if not self.settings.prefix_cache or not messages:
+            return 0
+        if messages[0].get("role") != "system" or len(messages) < 2:
+            return 0
+        prefix = messages[0].get("content") or ""
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        return estimate_tokens(prefix) if seen else 0
+
+    def _first_token_delay(self, cached_share: float = 0.0) -> float:
+        with self._lock:
+            factor = self._random.lognormvariate(0, self.settings.latency_sigma)
+            return self.settings.latency * factor * (1 - cached_share / 2)
+
+    def _fails(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.settings.error_rate
+
+    def _record(self, record: RequestRecord):
+        with self._lock:
+            self.records.append(record)
+
+    @staticmethod
+    def _reply(prompt: str, stage: str) -> str:
+        if stage == "reflect":
+            return "1. Keep terminology consistent.\n2. Prefer shorter sentences."
+        parts = PART.findall(prompt)
+        if parts:
+            return "\n".join(f"<PART {n}>\n{text}\n</PART {n}>" for n, text in parts)
+        chunks = TRANSLATE_THIS.findall(prompt)
+        text = chunks[-1] if chunks else prompt[:200]
+        return f"<TRANSLATION>\n{text}\n</TRANSLATION>"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": []})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                start = time.perf_counter()
+                length = int(self.headers.get("content-length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                key = self.headers.get("authorization", "").split(" ")[-1]
+                prompt = "\n".join(
+                    message.get("content") or ""
+                    for message in request.get("messages", [])
+                )
+                stage = classify_stage(prompt)
+                prompt_tokens = estimate_tokens(prompt)
+                cached_tokens = 0
+
+                def record(status: int, completion_tokens: int = 0):
+                    server._record(
+                        RequestRecord(
+                            stage=stage,
+                            key=key,
+                            status=status,
+                            prompt_tokens=prompt_tokens,
+                            completion_tokens=completion_tokens,
+                            latency=time.perf_counter() - start,
+                            cached_tokens=cached_tokens,
+                        )
+                    )
+
+                if server._rate_limited(key):
+                    record(429)
+                    self._send_json(
+                        429,
+                        {"error": {"message": "rate limited", "type": "rate_limit"}},
+                        {"retry-after": "1"},
+                    )
+                    return
+                if server._fails():
+                    record(500)
+                    self._send_json(500, {"error": {"message": "mock failure"}})
+                    return
+
+                reply = server._reply(prompt, stage)
+                completion_tokens = estimate_tokens(reply)
+                cached_tokens = server._cached_tokens(request.get("messages", []))
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                }
+                time.sleep(server._first_token_delay(cached_tokens / prompt_tokens))
+                generation_time = completion_tokens / server.settings.tokens_per_second
+                model = request.get("model", "mock")
+
+                if not request.get("stream"):
+                    time.sleep(generation_time)
+                    self._send_json(
+                        200,
+                        {
+                            "id": "mock",
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "model": model,
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {"role": "assistant", "content": reply},
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": usage,
+                        },
+                    )
+                    record(200, completion_tokens)
+                    return
+
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                pieces = [reply[i : i + 16] for i in range(0, len(reply), 16)]
+                for piece in pieces:
+                    time.sleep(generation_time / len(pieces))
+                    self._send_event(model, [{"index": 0, "delta": {"content": piece}}])
+                self._send_event(
+                    model, [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                )
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    self._send_event(model, [], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                record(200, completion_tokens)
+
+            def _send_event(self, model: str, choices: list, usage=None):
+                event = {
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": choices,
+                }
+                if usage:
+                    event["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    defaults = MockSettings()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(value) if value is not None else int,
+            default=value,
+        )
+    args = parser.parse_args()
+    settings = MockSettings(
+        **{name: getattr(args, name) for name in asdict(defaults)}
+    )
+
+    server = MockOpenAIServer(settings, host=args.host, port=args.port).start()
+    print(f"mock OpenAI server listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,4 @@
-import os
-from translatorrr import Translator
+from translatorrr import BatchRunner
 
-translator = Translator()
-
-for file in os.listdir("input"):
-    translator.translate_file(os.path.join("input", file))
+report = BatchRunner().run_folder("input")
+print(report.summary())
\ No newline at end of file
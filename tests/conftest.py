@@ -0,0 +1,12 @@
+import pytest
+
+from translatorrr.utils import get_encoding
+
+
+@pytest.fixture(scope="session")
+def tokenizer():
+    # tiktoken downloads its encoding on first use
+    try:
+        return get_encoding()
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {e!r}")
@@ -0,0 +1,94 @@
+from typing import List
+
+from benchmarks.corpus import generate_document
+from translatorrr.chunker import (
+    Chunk,
+    iter_blocks,
+    iter_lines,
+    split_markdown,
+    stream_markdown,
+)
+
+DOCUMENT = """# Guide
+
+Intro paragraph
+over two lines.
+
+## Install
+
+- first item
+- second item
+
+```python
+def main():
+
+    return 1
+```
+
+> a quote
+
+1. step one
+2. step two
+
+
+Closing words without a trailing newline"""
+
+
+def lines_of(text: str):
+    return ((start, text[start:end]) for start, end in iter_lines(text))
+
+
+def assert_covers(chunks: List[Chunk], text: str):
+    assert "".join(chunk.text for chunk in chunks) == text
+    end = 0
+    for chunk in chunks:
+        assert chunk.start == end
+        assert text[chunk.start : chunk.end] == chunk.text
+        assert chunk.tokens > 0
+        end = chunk.end
+    assert end == len(text)
+
+
+def test_blocks_cover_the_text_and_keep_fences_whole():
+    blocks = list(iter_blocks(lines_of(DOCUMENT)))
+
+    assert "".join(block for _, block in blocks) == DOCUMENT
+    for offset, block in blocks:
+        assert DOCUMENT[offset : offset + len(block)] == block
+    fenced = [block for _, block in blocks if block.startswith("```")]
+    assert fenced == ["```python\ndef main():\n\n    return 1\n```\n\n"]
+
+
+def test_split_markdown_is_lossless(tokenizer):
+    for token_limit in (10, 40, 1000):
+        assert_covers(split_markdown(DOCUMENT, token_limit=token_limit), DOCUMENT)
+
+
+def test_split_markdown_cuts_oversized_blocks(tokenizer):
+    text = " ".join(f"word{i}" for i in range(500)) + "\n"
+
+    chunks = split_markdown(text, token_limit=100)
+
+    assert len(chunks) > 1
+    assert_covers(chunks, text)
+
+
+def test_split_markdown_of_empty_text(tokenizer):
+    assert split_markdown("") == []
+
+
+def test_stream_markdown_matches_the_source_offsets(tokenizer):
+    for seed in range(5):
+        text = generate_document(seed, sections=4)
+        for token_limit in (50, 1000):
+            chunks = list(stream_markdown(lines_of(text), token_limit))
+            assert_covers(chunks, text)
+
+
+def test_stream_markdown_transforms_blocks_in_place(tokenizer):
+    chunks = list(stream_markdown(lines_of(DOCUMENT), 40, transform=str.upper))
+
+    assert "".join(chunk.text for chunk in chunks) == DOCUMENT.upper()
+    assert chunks[0].start == 0
+    for before, after in zip(chunks, chunks[1:]):
+        assert before.end == after.start
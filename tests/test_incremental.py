@@ -0,0 +1,84 @@
+from typing import List, Tuple
+
+from translatorrr.incremental import ChunkPlan, ChunkState, DocumentState, plan_chunks
+
+TOKEN_LIMIT = 250
+SOURCE = ["# Title\n\n"] + [f"Paragraph {i}.\n\n" for i in range(1, 12)]
+
+
+def make_blocks(texts: List[str], tokens: int = 100) -> List[Tuple[int, str, int]]:
+    blocks, offset = [], 0
+    for text in texts:
+        blocks.append((offset, text, tokens))
+        offset += len(text)
+    return blocks
+
+
+def saved_state(plan: ChunkPlan) -> DocumentState:
+    # every chunk's "translation" names its source, so reuse is easy to check
+    return DocumentState(
+        output_path="Title.md",
+        chunks=[
+            ChunkState(blocks=hashes, translation="T:" + plan.chunks[i].text)
+            for i, hashes in enumerate(plan.block_hashes)
+        ],
+    )
+
+
+def replan(texts: List[str]) -> ChunkPlan:
+    previous = saved_state(plan_chunks(make_blocks(SOURCE), TOKEN_LIMIT))
+    plan = plan_chunks(make_blocks(texts), TOKEN_LIMIT, previous)
+    assert "".join(chunk.text for chunk in plan.chunks) == "".join(texts)
+    for i, translation in plan.reused.items():
+        assert translation == "T:" + plan.chunks[i].text
+    return plan
+
+
+def chunk_texts(plan: ChunkPlan) -> List[str]:
+    return [chunk.text.replace("\n\n", "|") for chunk in plan.chunks]
+
+
+def test_first_run_reuses_nothing():
+    plan = plan_chunks(make_blocks(SOURCE), TOKEN_LIMIT)
+
+    assert len(plan.chunks) == 6
+    assert plan.reused == {}
+    assert [len(hashes) for hashes in plan.block_hashes] == [2] * 6
+
+
+def test_unchanged_document_reuses_every_chunk():
+    plan = replan(SOURCE)
+
+    assert sorted(plan.reused) == list(range(6))
+
+
+def test_edit_retranslates_the_chunk_and_its_neighbours():
+    plan = replan(SOURCE[:5] + ["Edited.\n\n"] + SOURCE[6:])
+
+    assert chunk_texts(plan)[2] == "Paragraph 4.|Edited.|"
+    assert sorted(plan.reused) == [0, 4, 5]
+
+
+def test_insert_packs_new_blocks_into_their_own_chunk():
+    plan = replan(SOURCE[:6] + ["New.\n\n"] + SOURCE[6:])
+
+    assert chunk_texts(plan)[2:5] == [
+        "Paragraph 4.|Paragraph 5.|",
+        "New.|",
+        "Paragraph 6.|Paragraph 7.|",
+    ]
+    assert sorted(plan.reused) == [0, 1, 5, 6]
+
+
+def test_delete_retranslates_the_chunk_and_its_neighbours():
+    plan = replan(SOURCE[:5] + SOURCE[6:])
+
+    assert chunk_texts(plan)[2] == "Paragraph 4.|"
+    assert sorted(plan.reused) == [0, 4, 5]
+
+
+def test_renamed_first_heading_retranslates_only_the_start():
+    plan = replan(["# Other title\n\n"] + SOURCE[1:])
+
+    assert chunk_texts(plan)[0] == "# Other title|Paragraph 1.|"
+    assert sorted(plan.reused) == [2, 3, 4, 5]
@@ -0,0 +1,61 @@
+import asyncio
+from typing import List, Optional
+
+from translatorrr.llm import LLM, Completion, GenerationCancelled, LLMSettings
+
+
+def make_llm(**settings) -> LLM:
+    return LLM(
+        settings=LLMSettings(
+            _env_file=None,
+            gemini_api_keys="mock-key-0,mock-key-1",
+            mission_model="gemini-1.5-flash-002",
+            retry_base_delay=0,
+            **settings,
+        )
+    )
+
+
+def streamed_text(deltas: List[Optional[str]]) -> str:
+    text = ""
+    for delta in deltas:
+        text = "" if delta is None else text + delta
+    return text
+
+
+def test_retry_resets_the_text_streamed_by_a_failed_attempt(tokenizer):
+    llm = make_llm(max_retries=2)
+    attempts = []
+
+    async def attempt(prompt, on_delta, max_output_tokens, estimated_tokens):
+        attempts.append(prompt)
+        on_delta("runaway ")
+        if len(attempts) == 1:
+            raise GenerationCancelled("output passed its limit")
+        on_delta("answer")
+        return Completion(text="runaway answer", key="k", model="m")
+
+    llm._attempt = attempt
+    deltas = []
+    asyncio.run(llm.acall("hello", on_delta=deltas.append, retry_cancelled=True))
+
+    assert deltas == ["runaway ", None, "runaway ", "answer"]
+    assert streamed_text(deltas) == "runaway answer"
+
+
+def test_winning_hedge_replaces_the_streamed_text(tokenizer):
+    llm = make_llm(hedge_percentile=50, hedge_min_samples=1)
+    llm.recent_calls.append(Completion(text="", key="k", model="m", latency=0.01))
+
+    async def attempt(prompt, on_delta, max_output_tokens, estimated_tokens):
+        if on_delta is None:
+            return Completion(text="fast", key="k", model="m")
+        on_delta("slow ")
+        await asyncio.sleep(5)
+
+    llm._attempt = attempt
+    deltas = []
+    completion = asyncio.run(llm.acall("hello", on_delta=deltas.append))
+
+    assert completion.hedged
+    assert deltas == ["slow ", None, "fast"]
@@ -0,0 +1,62 @@
+from translatorrr.masking import (
+    StreamMasker,
+    ensure_placeholders,
+    placeholders_in,
+)
+
+BLOCKS = [
+    "# Setup\n\nRun `pip install .` and see [the docs](https://example.com/docs).\n\n",
+    "```python\nprint('$x$')\n```\n\n",
+    "Inline $e^{i\\pi}$ and $$\\sum_i x_i$$ math.\n\n",
+    "Plain text without spans.\n\n",
+    "![logo](img/logo.png) from <https://example.com>.\n\n",
+]
+
+
+def test_take_numbers_each_chunk_from_zero_and_round_trips():
+    masker = StreamMasker()
+    masked_blocks = [masker.mask(block) for block in BLOCKS]
+
+    chunks = [masker.take(text) for text in masked_blocks]
+
+    for block, masked in zip(BLOCKS, chunks):
+        assert placeholders_in(masked.text) == set(range(len(masked.spans)))
+        assert masked.restore(masked.text) == block
+    assert [len(masked.spans) for masked in chunks] == [2, 1, 2, 0, 2]
+    assert "pip install" not in chunks[0].text
+    assert "print" not in chunks[1].text
+
+
+def test_take_drops_the_spans_it_hands_out():
+    masker = StreamMasker()
+    first, second = masker.mask(BLOCKS[0]), masker.mask(BLOCKS[2])
+
+    assert masker.restore(first + second) == BLOCKS[0] + BLOCKS[2]
+    masker.take(first)
+
+    assert masker.restore(first) == first
+    assert masker.restore(second) == BLOCKS[2]
+    assert masker.take(first).spans == []
+
+
+def test_masking_whole_text_or_block_by_block_agrees():
+    whole, blocks = StreamMasker(), StreamMasker()
+
+    assert whole.mask("".join(BLOCKS)) == "".join(
+        blocks.mask(block) for block in BLOCKS
+    )
+
+
+def test_restore_keeps_unknown_placeholders():
+    masker = StreamMasker()
+    chunk = masker.take(masker.mask("See `code`."))
+
+    assert chunk.restore("Voir @@0@@ et @@ 7 @@.") == "Voir `code` et @@ 7 @@."
+
+
+def test_ensure_placeholders():
+    source = "a @@0@@ b @@1@@"
+
+    assert ensure_placeholders(source, "x @@1@@ y @@ 0 @@") == "x @@1@@ y @@ 0 @@"
+    assert ensure_placeholders(source, "x @@1@@", source) == source
+    assert ensure_placeholders(source, "x @@1@@", "y") == "x @@1@@\n\n@@0@@"
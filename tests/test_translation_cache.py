@@ -0,0 +1,74 @@
+import json
+
+from translatorrr.translator import TranslationCache
+
+
+def journal_lines(cache: TranslationCache, name: str):
+    with open(cache._get_journal_path(name), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_entries_survive_a_reload(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    cache.append("improve", 1, "un")
+    cache.append("improve", 0, "zéro")
+    cache.flush()
+
+    assert TranslationCache(str(tmp_path)).load_entries("improve") == {
+        0: "zéro",
+        1: "un",
+    }
+
+
+def test_torn_last_line_is_skipped_and_compacted(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    for idx in range(3):
+        cache.append("basic", idx, f"chunk {idx}")
+    cache.flush()
+    # a crash in the middle of writing the fourth record
+    with open(cache._get_journal_path("basic"), "a", encoding="utf-8") as f:
+        f.write('{"idx": 3, "res')
+
+    entries = TranslationCache(str(tmp_path)).load_entries("basic")
+
+    assert entries == {0: "chunk 0", 1: "chunk 1", 2: "chunk 2"}
+    assert journal_lines(cache, "basic") == [
+        {"idx": idx, "result": f"chunk {idx}"} for idx in range(3)
+    ]
+
+
+def test_appends_after_a_torn_line_are_kept(tmp_path):
+    path = str(tmp_path)
+    with open(
+        TranslationCache(path)._get_journal_path("basic"), "w", encoding="utf-8"
+    ) as f:
+        f.write('{"idx": 0, "result": "a"}\n{"idx": 1, "re')
+
+    cache = TranslationCache(path)
+    assert cache.load_entries("basic") == {0: "a"}
+    cache.append("basic", 1, "b")
+    cache.flush()
+
+    assert TranslationCache(path).load_entries("basic") == {0: "a", 1: "b"}
+
+
+def test_rewritten_chunks_keep_the_last_result(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    cache.append("basic", 0, "first")
+    cache.append("basic", 0, "second")
+    cache.flush()
+
+    assert cache.load_entries("basic") == {0: "second"}
+    assert journal_lines(cache, "basic") == [{"idx": 0, "result": "second"}]
+
+
+def test_legacy_json_checkpoint_is_replayed_into_the_journal(tmp_path):
+    cache = TranslationCache(str(tmp_path))
+    with open(cache._get_cache_path("basic"), "w", encoding="utf-8") as f:
+        json.dump({"done_idx": 1, "results": ["a", "b"]}, f)
+    with open(cache._get_journal_path("basic"), "w", encoding="utf-8") as f:
+        f.write('{"idx": 2, "result": "c"}\n')
+
+    assert cache.load_entries("basic") == {0: "a", 1: "b", 2: "c"}
+    assert not (tmp_path / "basic.json").exists()
+    assert len(journal_lines(cache, "basic")) == 3
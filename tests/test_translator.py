@@ -0,0 +1,66 @@
+import os
+
+from benchmarks.mock_server import MockOpenAIServer, MockSettings
+from translatorrr.batch import BatchRunner
+from translatorrr.llm import LLM, LLMSettings
+from translatorrr.translator import TranslationCache, Translator, TranslatorSettings
+
+
+def mock_translator(server: MockOpenAIServer, workdir: str, **settings) -> Translator:
+    llm_settings = LLMSettings(
+        _env_file=None,
+        gemini_api_keys="mock-key-0,mock-key-1",
+        gemini_base_url=server.base_url,
+        openai_base_url=server.base_url,
+        mission_model="gemini-1.5-flash-002",
+        max_retries=0,
+        stream=False,
+    )
+    return Translator(
+        settings=TranslatorSettings(
+            _env_file=None,
+            output_folder=os.path.join(workdir, "output"),
+            memory_path="",
+            show_progress=False,
+            **settings,
+        ),
+        llm=LLM(settings=llm_settings),
+        cacher=TranslationCache(os.path.join(workdir, "cache")),
+    )
+
+
+def test_translate_file_twice_reuses_no_closed_connections(tmp_path, tokenizer):
+    # non-streamed replies keep their connection alive for the next request
+    with MockOpenAIServer(MockSettings(latency=0.01, seed=0)) as server:
+        translator = mock_translator(server, str(tmp_path))
+        for i in range(2):
+            path = tmp_path / f"doc{i}.md"
+            path.write_text(f"# Document {i}\n\nSome text to translate.\n")
+
+            output = translator.translate_file(str(path))
+
+            assert os.path.exists(output)
+            assert not path.exists()
+
+
+def test_same_named_documents_of_one_batch_keep_both_outputs(tmp_path, tokenizer):
+    paths = []
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        path = tmp_path / folder / "README.md"
+        path.write_text(f"Notes from folder {folder}.\n")
+        paths.append(str(path))
+
+    with MockOpenAIServer(MockSettings(latency=0.01, seed=0)) as server:
+        report = BatchRunner(mock_translator(server, str(tmp_path))).run(paths)
+
+    assert report.failures == {}
+    outputs = sorted(report.outputs.values())
+    assert [os.path.basename(output) for output in outputs] == [
+        "README (2).md",
+        "README.md",
+    ]
+    assert len({open(output).read() for output in outputs}) == 2
+    assert not [
+        name for name in os.listdir(tmp_path / "output") if name.startswith(".")
+    ]
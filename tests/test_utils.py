@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from translatorrr.utils import (
+    TranslationCleaner,
+    clean_translation,
+    remove_hash_chars_lines,
+    replace_chinese_parentheses,
+    replace_multiple_newlines,
+    replace_spaces_in_links,
+)
+
+PIECES = [" ", "\t", "#", "##", "\n", "\n", "a", "[l](u v)", "[l]（u w）"]
+
+
+def four_passes(text: str) -> str:
+    # the cleanup clean_translation replaces
+    text = remove_hash_chars_lines(text)
+    text = replace_chinese_parentheses(text)
+    text = replace_spaces_in_links(text)
+    return replace_multiple_newlines(text)
+
+
+def clean_in_pieces(text: str, rng: random.Random) -> str:
+    cleaner = TranslationCleaner()
+    output, pos = [], 0
+    while pos < len(text):
+        size = rng.randrange(1, 6)
+        output.append(cleaner.feed(text[pos : pos + size]))
+        pos += size
+    output.append(cleaner.finish())
+    return "".join(output)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("  #  \n  #  \n   #  \na", "\n\na"),
+        ("a\n\n\n\nb", "a\n\nb"),
+        ("a\n#\n##\nb\n", "a\n\nb\n"),
+        ("see [docs](my page.md)", "see [docs](my%20page.md)"),
+        ("see [docs]（my page.md）", "see [docs](my%20page.md)"),
+        ("# Title\n\ntext #\n", "# Title\n\ntext #\n"),
+    ],
+)
+def test_clean_translation(text, expected):
+    assert clean_translation(text) == expected
+    assert four_passes(text) == expected
+
+
+def test_clean_translation_matches_the_four_passes():
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randrange(14)))
+        expected = four_passes(text)
+        assert clean_translation(text) == expected, text
+        assert clean_in_pieces(text, rng) == expected, text
+
+
+def test_cleaner_holds_back_an_unfinished_gap():
+    cleaner = TranslationCleaner()
+
+    assert cleaner.feed("first\n\n") == ""
+    assert cleaner.feed("\n\n#\n") == ""
+    assert cleaner.feed("second\nthird") == "first\n\nsecond"
+    assert cleaner.finish() == "\nthird"
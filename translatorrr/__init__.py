@@ -1,3 +1,22 @@
-from .translator import Translator
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = ["Translator"]
\ No newline at end of file
+if TYPE_CHECKING:
+    from .batch import BatchReport, BatchRunner
+    from .translator import Translator
+
+__all__ = ["Translator", "BatchRunner", "BatchReport"]
+
+# the translation stack is imported on first use, so `import translatorrr`
+# and the CLI start fast
+_EXPORTS = {
+    "Translator": ".translator",
+    "BatchRunner": ".batch",
+    "BatchReport": ".batch",
+}
+
+
+def __getattr__(name: str):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from tqdm import tqdm
+
+from .translator import Translator
+
+
+@dataclass
+class BatchReport:
+    documents: int = 0
+    outputs: Dict[str, str] = field(default_factory=dict)
+    failures: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    pipeline_mode: str = "full"
+    stage_calls: int = 0
+    stage_calls_saved: int = 0
+
+    @property
+    def docs_per_minute(self) -> float:
+        return len(self.outputs) / self.elapsed * 60 if self.elapsed else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        tokens = self.prompt_tokens + self.completion_tokens
+        return tokens / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        lines = [
+            f"documents: {len(self.outputs)}/{self.documents} translated"
+            f" in {self.elapsed:.1f}s",
+            f"throughput: {self.docs_per_minute:.2f} docs/min,"
+            f" {self.tokens_per_second:.1f} tokens/s",
+            f"llm: {self.llm_calls} calls, {self.prompt_tokens} prompt tokens"
+            f" ({self.cached_tokens} cached),"
+            f" {self.completion_tokens} completion tokens",
+            f"pipeline: {self.pipeline_mode}, {self.stage_calls} stage calls,"
+            f" {self.stage_calls_saved} saved against full",
+            f"failures: {len(self.failures)}",
+        ]
+        lines += [f"  {path}: {error}" for path, error in self.failures.items()]
+        return "\n".join(lines)
+
+
+@dataclass
+class BatchRunner:
+    """Translates many documents concurrently with one shared ``Translator``.
+
+    Every document checkpoints into its own cache namespace, while the
+    translator's LLM (concurrency limit and key pool) caps the whole batch.
+    """
+
+    translator: Translator = field(default_factory=Translator)
+    max_documents: int = 4
+
+    def run(self, paths: List[str]) -> BatchReport:
+        return self.translator.llm.run(self.arun(paths))
+
+    def run_folder(self, folder: str) -> BatchReport:
+        paths = sorted(
+            os.path.join(folder, name)
+            for name in os.listdir(folder)
+            if os.path.isfile(os.path.join(folder, name))
+        )
+        return self.run(paths)
+
+    async def arun(self, paths: List[str]) -> BatchReport:
+        policy = self.translator.policy
+        report = BatchReport(documents=len(paths), pipeline_mode=policy.mode)
+        usage_before = dict(self.translator.llm.usage)
+        calls_before, saved_before = policy.stats.calls, policy.stats.saved
+        slots = asyncio.Semaphore(self.max_documents)
+        progress = tqdm(
+            total=len(paths),
+            desc="documents",
+            disable=not self.translator.settings.show_progress,
+        )
+
+        async def run_one(path: str):
+            async with slots:
+                try:
+                    if self.translator.targets:
+                        outputs = await self.translator.atranslate_file_to(path)
+                        report.outputs[path] = ", ".join(outputs.values())
+                    else:
+                        report.outputs[path] = await self.translator.atranslate_file(
+                            path
+                        )
+                except Exception as e:
+                    report.failures[path] = repr(e)
+                progress.update()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(run_one(path) for path in paths))
+        finally:
+            progress.close()
+
+        report.elapsed = time.perf_counter() - start
+        usage = self.translator.llm.usage
+        report.llm_calls = usage["calls"] - usage_before["calls"]
+        report.prompt_tokens = usage["prompt_tokens"] - usage_before["prompt_tokens"]
+        report.cached_tokens = usage["cached_tokens"] - usage_before["cached_tokens"]
+        report.completion_tokens = (
+            usage["completion_tokens"] - usage_before["completion_tokens"]
+        )
+        report.stage_calls = policy.stats.calls - calls_before
+        report.stage_calls_saved = policy.stats.saved - saved_before
+        return report
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import regex as re
+
+from .utils import calculate_chunk_size, get_encoding
+
+LINE_PATTERN = re.compile(r"[^\n]*\n|[^\n]+")
+FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+BLOCK_START_PATTERN = re.compile(r"^\s{0,3}(#{1,6}\s|[-*+]\s|\d+[.)]\s|>)")
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+class ChunkWindow:
+    """List-like sequence of streamed chunks that only holds the recent ones.
+
+    Indices keep counting from the first chunk; released chunks are gone.
+    """
+
+    def __init__(self):
+        self._chunks: Dict[int, Chunk] = {}
+        self._count = 0
+
+    def append(self, chunk: Chunk):
+        self._chunks[self._count] = chunk
+        self._count += 1
+
+    def release(self, i: int):
+        self._chunks.pop(i, None)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Chunk]:
+        return iter(list(self._chunks.values()))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._chunks[i] for i in range(*key.indices(self._count))]
+        return self._chunks[key]
+
+
+def iter_lines(text: str) -> Iterator[Tuple[int, int]]:
+    for match in LINE_PATTERN.finditer(text):
+        yield match.start(), match.end()
+
+
+def iter_blocks(lines: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    """Group ``(offset, line)`` pairs into markdown blocks.
+
+    A block is a heading, a list item, a quote, a paragraph or a whole fenced
+    block; the blank lines after a block belong to it, so the yielded
+    ``(offset, text)`` pairs cover the input without gaps.
+    """
+    start, parts = 0, []
+    fence = None
+    trailing_blank = False
+
+    for offset, line in lines:
+        stripped = line.strip()
+        if fence is not None:
+            parts.append(line)
+            if stripped.startswith(fence):
+                fence = None
+                trailing_blank = True
+            continue
+
+        opens_fence = FENCE_PATTERN.match(line)
+        starts_block = (
+            (trailing_blank and stripped)
+            or opens_fence
+            or BLOCK_START_PATTERN.match(line)
+        )
+        if parts and starts_block:
+            yield start, "".join(parts)
+            parts = []
+        if not parts:
+            start = offset
+
+        parts.append(line)
+        trailing_blank = not stripped
+        if opens_fence:
+            fence = opens_fence.group(1)
+
+    if parts:
+        yield start, "".join(parts)
+
+
+def _split_oversized(
+    start: int, text: str, tokens: int, chunk_size: int
+) -> Iterator[Tuple[int, str, int]]:
+    # cut long blocks near chunk_size worth of characters, on whitespace
+    chars_per_chunk = max(1, len(text) * chunk_size // tokens)
+    pos = 0
+    while len(text) - pos > chars_per_chunk:
+        cut = text.rfind("\n", pos + 1, pos + chars_per_chunk + 1)
+        if cut == -1:
+            cut = text.rfind(" ", pos + 1, pos + chars_per_chunk + 1)
+        cut = pos + chars_per_chunk if cut == -1 else cut + 1
+        part = text[pos:cut]
+        yield start + pos, part, tokens * len(part) // len(text)
+        pos = cut
+    part = text[pos:]
+    yield start + pos, part, tokens - tokens * pos // len(text)
+
+
+def split_oversized(
+    blocks: Iterable[Tuple[int, str, int]], chunk_size: int
+) -> Iterator[Tuple[int, str, int]]:
+    for offset, text, tokens in blocks:
+        if tokens > chunk_size:
+            yield from _split_oversized(offset, text, tokens, chunk_size)
+        else:
+            yield offset, text, tokens
+
+
+def pack_blocks(
+    blocks: Iterable[Tuple[int, str, int]], chunk_size: int
+) -> Iterator[Chunk]:
+    """Greedily pack ``(offset, text, tokens)`` blocks into chunks."""
+    parts: List[str] = []
+    start = tokens = 0
+
+    for piece_offset, piece, piece_tokens in split_oversized(blocks, chunk_size):
+        if parts and tokens + piece_tokens > chunk_size:
+            chunk_text = "".join(parts)
+            yield Chunk(chunk_text, start, start + len(chunk_text), tokens)
+            parts, tokens = [], 0
+        if not parts:
+            start = piece_offset
+        parts.append(piece)
+        tokens += piece_tokens
+
+    if parts:
+        chunk_text = "".join(parts)
+        yield Chunk(chunk_text, start, start + len(chunk_text), tokens)
+
+
+def split_markdown(
+    text: str,
+    token_limit: int = 1000,
+    encoding_name: str = "o200k_base",
+) -> List[Chunk]:
+    """Split markdown into chunks of roughly even size below ``token_limit``.
+
+    Every block is tokenized exactly once; the counts feed both the chunk size
+    calculation and the ``tokens`` of the returned chunks.
+    """
+    blocks = tokenized_blocks(text, encoding_name)
+    token_count = sum(tokens for _, _, tokens in blocks)
+    if not token_count:
+        return []
+    chunk_size = calculate_chunk_size(
+        token_count=token_count, token_limit=token_limit
+    )
+    return list(pack_blocks(blocks, chunk_size))
+
+
+def tokenized_blocks(
+    text: str, encoding_name: str = "o200k_base"
+) -> List[Tuple[int, str, int]]:
+    encoding = get_encoding(encoding_name)
+    lines = ((start, text[start:end]) for start, end in iter_lines(text))
+    return [
+        (offset, block, len(encoding.encode(block, disallowed_special=())))
+        for offset, block in iter_blocks(lines)
+    ]
+
+
+def stream_markdown(
+    lines: Iterable[Tuple[int, str]],
+    token_limit: int = 1000,
+    encoding_name: str = "o200k_base",
+    transform: Optional[Callable[[str], str]] = None,
+) -> Iterator[Chunk]:
+    """Lazy ``split_markdown`` over ``(offset, line)`` pairs.
+
+    The total size is unknown up front, so chunks are filled up to
+    ``token_limit`` instead of being evened out. ``transform`` rewrites every
+    block before it is tokenized.
+    """
+    encoding = get_encoding(encoding_name)
+    blocks = iter_blocks(lines)
+    if transform is not None:
+        blocks = ((offset, transform(block)) for offset, block in blocks)
+    return pack_blocks(
+        (
+            (offset, block, len(encoding.encode(block, disallowed_special=())))
+            for offset, block in blocks
+        ),
+        token_limit,
+    )
@@ -0,0 +1,201 @@
+"""Command line interface.
+
+    translatorrr translate input/guide.md docs/ --targets "Japanese:Japan"
+    translatorrr status
+    translatorrr cache-stats
+
+Every command imports only what it needs, so ``status`` and ``--help`` do
+not load the LLM stack. ``translate`` keeps its source files unless
+``--delete-source`` is given.
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+
+def _collect(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if not name.startswith(".")
+                and name.lower().endswith(MARKDOWN_EXTENSIONS)
+                and os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def _print(data: Dict, as_json: bool):
+    if as_json:
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+        return
+    for name, value in data.items():
+        if isinstance(value, dict):
+            print(f"{name}:")
+            for key, item in value.items():
+                print(f"  {key}: {item}")
+        elif isinstance(value, list):
+            print(f"{name}:")
+            for item in value:
+                print(f"  {item}")
+        else:
+            print(f"{name}: {value}")
+
+
+def translate(args) -> int:
+    from .batch import BatchRunner
+    from .translator import Translator, TranslatorSettings
+
+    overrides = dict(
+        output_folder=args.output,
+        source_lang=args.source_lang,
+        target_lang=args.target_lang,
+        country=args.country,
+        target_langs=args.targets,
+        pipeline_mode=args.mode,
+        delete_source=args.delete_source,
+    )
+    settings = TranslatorSettings(
+        **{k: v for k, v in overrides.items() if v is not None}
+    )
+    paths = _collect(args.paths)
+    if not paths:
+        print("nothing to translate")
+        return 1
+
+    runner = BatchRunner(Translator(settings=settings), max_documents=args.documents)
+    report = runner.run(paths)
+    print(report.summary())
+    return 1 if report.failures else 0
+
+
+def status(args) -> int:
+    from .daemon import DaemonSettings
+    from .jobs import JobQueue
+
+    path = args.jobs or DaemonSettings().jobs_path
+    if not os.path.exists(path):
+        print(f"no job queue at {path}")
+        return 1
+
+    queue = JobQueue(path)
+    try:
+        data = {
+            "jobs": queue.counts(),
+            "recent": [
+                f"#{job.id} {job.status} {job.path}"
+                + (f" -> {job.output}" if job.output else "")
+                + (f" ({job.error})" if job.error else "")
+                for job in queue.list(status=args.status, limit=args.limit)
+            ],
+        }
+    finally:
+        queue.close()
+    _print(data, args.json)
+    return 0
+
+
+def cache_stats(args) -> int:
+    from .memory import TranslationMemory
+
+    data = {}
+    memory_path = args.memory
+    if memory_path is None:
+        from .translator import TranslatorSettings
+
+        memory_path = TranslatorSettings().memory_path
+    if memory_path and os.path.exists(memory_path):
+        memory = TranslationMemory(memory_path)
+        try:
+            stats = memory.stats()
+        finally:
+            memory.close()
+        data["memory"] = {
+            "path": memory_path,
+            "entries": stats["entries"],
+            "bytes": stats["bytes"],
+            "lifetime_hits": stats["lifetime_hits"],
+        }
+    else:
+        data["memory"] = {"path": memory_path or "disabled", "entries": 0}
+
+    # every document checkpoints into its own namespace below the cache folder
+    documents = journals = size = 0
+    if os.path.isdir(args.cache):
+        for entry in os.scandir(args.cache):
+            if entry.is_dir():
+                documents += 1
+            for root, _, files in os.walk(entry.path):
+                for name in files:
+                    journals += name.endswith(".jsonl")
+                    size += os.path.getsize(os.path.join(root, name))
+    data["checkpoints"] = {
+        "path": args.cache,
+        "documents": documents,
+        "journals": journals,
+        "bytes": size,
+    }
+    _print(data, args.json)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="translatorrr", description="Translate markdown documents with LLMs."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("translate", help="translate files or folders")
+    run.add_argument("paths", nargs="+", help="markdown files or folders of them")
+    run.add_argument(
+        "--delete-source",
+        action="store_true",
+        help="remove every source file once it is translated",
+    )
+    run.add_argument("--output", help="output folder")
+    run.add_argument("--source-lang")
+    run.add_argument("--target-lang")
+    run.add_argument("--country")
+    run.add_argument(
+        "--targets", help='several languages at once, "Japanese:Japan, German:Germany"'
+    )
+    run.add_argument("--mode", choices=["fast", "full", "adaptive"])
+    run.add_argument(
+        "--documents", type=int, default=4, help="documents translated in parallel"
+    )
+    run.set_defaults(func=translate)
+
+    jobs = commands.add_parser("status", help="show the daemon's job queue")
+    jobs.add_argument("--jobs", help="job queue database, default JOBS_PATH")
+    jobs.add_argument(
+        "--status", choices=["queued", "running", "done", "failed"], default=None
+    )
+    jobs.add_argument("--limit", type=int, default=20)
+    jobs.add_argument("--json", action="store_true")
+    jobs.set_defaults(func=status)
+
+    stats = commands.add_parser(
+        "cache-stats", help="show translation memory and checkpoint usage"
+    )
+    stats.add_argument("--memory", help="memory database, default MEMORY_PATH")
+    stats.add_argument("--cache", default="cache", help="checkpoint folder")
+    stats.add_argument("--json", action="store_true")
+    stats.set_defaults(func=cache_stats)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal
+
+import regex as re
+
+from .chunker import FENCE_PATTERN, Chunk
+
+ContextMode = Literal["full", "window", "summary"]
+
+HEADING_PATTERN = re.compile(r"^\s{0,3}(#{1,6})\s+\S")
+SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s")
+ELISION = "..."
+
+
+class HeadingTrail:
+    """Follows the headings of a document chunk by chunk, fence-aware."""
+
+    def __init__(self):
+        self._trail: List[str] = []
+        self._fence = None
+
+    def feed(self, chunk: Chunk) -> List[str]:
+        """The headings in force where ``chunk`` starts, outermost first."""
+        trail = list(self._trail)
+        for line in chunk.text.splitlines():
+            match = FENCE_PATTERN.match(line)
+            if match:
+                marker = match.group(1)
+                if self._fence is None:
+                    self._fence = marker
+                elif marker.startswith(self._fence):
+                    self._fence = None
+                continue
+            match = HEADING_PATTERN.match(line)
+            if self._fence is None and match:
+                level = len(match.group(1))
+                self._trail = [
+                    h for h in self._trail if len(h) - len(h.lstrip("#")) < level
+                ]
+                self._trail.append(line.strip())
+        return trail
+
+
+def summarize_chunk(text: str) -> str:
+    """Headings plus the first sentence of every paragraph."""
+    lines = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if HEADING_PATTERN.match(paragraph):
+            lines.append(paragraph.splitlines()[0])
+            continue
+        first = SENTENCE_END.split(" ".join(paragraph.split()), maxsplit=1)[0]
+        lines.append(first)
+    return "\n\n".join(lines)
+
+
+@dataclass
+class ContextBuilder:
+    """Builds the tagged source context of each chunk for reflect and improve.
+
+    ``full`` sends up to two previous chunks and the next one verbatim. The
+    ``window`` and ``summary`` modes fit the neighbours, verbatim or reduced
+    to headings and first sentences, into ``budget`` tokens, and keep the
+    chunk's heading trail for document-level context. Every context is built
+    once and shared by both stages.
+
+    Chunks of a stream are appended with ``add``; a chunk's context is
+    complete once the ``after`` chunks following it were added.
+    """
+
+    chunks: List[Chunk]
+    mode: ContextMode = "window"
+    budget: int = 600
+    before: int = 2
+    after: int = 1
+    _headings: HeadingTrail = field(init=False, default_factory=HeadingTrail)
+    _trails: Dict[int, List[str]] = field(init=False, default_factory=dict)
+    _summaries: Dict[int, str] = field(init=False, default_factory=dict)
+    _tagged: Dict[int, str] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        if self.mode != "full":
+            for i, chunk in enumerate(self.chunks):
+                self._trails[i] = self._headings.feed(chunk)
+
+    def add(self, chunk: Chunk):
+        self.chunks.append(chunk)
+        if self.mode != "full":
+            self._trails[len(self.chunks) - 1] = self._headings.feed(chunk)
+
+    def tagged_text(self, i: int) -> str:
+        if i not in self._tagged:
+            self._tagged[i] = self._build(i)
+        return self._tagged[i]
+
+    def release(self, i: int):
+        self._tagged.pop(i, None)
+        self._trails.pop(i, None)
+        # later chunks only look back `before` chunks
+        self._summaries.pop(i - self.before, None)
+
+    def _build(self, i: int) -> str:
+        previous = self.chunks[max(i - self.before, 0) : i]
+        following = self.chunks[i + 1 : i + 1 + self.after]
+
+        if self.mode == "summary":
+            start = i - len(previous)
+            before = "".join(self._summary(j) + "\n\n" for j in range(start, i))
+            after = "".join(
+                "\n\n" + self._summary(j) for j in range(i + 1, i + 1 + len(following))
+            )
+        else:
+            before = "".join(chunk.text for chunk in previous)
+            after = "".join(chunk.text for chunk in following)
+
+        if self.mode != "full":
+            before_budget = self.budget * 2 // 3
+            before = self._tail(before, before_budget, previous)
+            after = self._head(after, self.budget - before_budget, following)
+            trail = [h for h in self._trails[i] if h not in before]
+            if trail:
+                before = "\n\n".join(trail) + "\n\n" + before
+
+        return (
+            before
+            + "<TRANSLATE_THIS>"
+            + self.chunks[i].text
+            + "</TRANSLATE_THIS>"
+            + after
+        )
+
+    def _summary(self, j: int) -> str:
+        if j not in self._summaries:
+            self._summaries[j] = summarize_chunk(self.chunks[j].text)
+        return self._summaries[j]
+
+    @staticmethod
+    def _chars(tokens: int, chunks: List[Chunk]) -> int:
+        # the chunks' own text/token ratio avoids tokenizing the context again
+        total_tokens = sum(chunk.tokens for chunk in chunks)
+        total_chars = sum(len(chunk.text) for chunk in chunks)
+        if not total_tokens:
+            return 4 * tokens
+        return int(tokens * total_chars / total_tokens)
+
+    def _tail(self, text: str, tokens: int, chunks: List[Chunk]) -> str:
+        max_chars = self._chars(tokens, chunks)
+        if len(text) <= max_chars:
+            return text
+        start = len(text) - max_chars
+        cut = text.find("\n", start)
+        # a single long line is cut between words instead
+        if cut == -1 or not text[cut + 1 :].strip():
+            cut = text.find(" ", start)
+        if cut == -1:
+            return ""
+        return ELISION + "\n" + text[cut + 1 :]
+
+    def _head(self, text: str, tokens: int, chunks: List[Chunk]) -> str:
+        max_chars = self._chars(tokens, chunks)
+        if len(text) <= max_chars:
+            return text
+        cut = text.rfind("\n", 0, max_chars)
+        if cut == -1 or not text[: cut + 1].strip():
+            cut = text.rfind(" ", 0, max_chars)
+        if cut == -1:
+            return ""
+        return text[: cut + 1] + ELISION
@@ -0,0 +1,319 @@
+"""Long-running translation service.
+
+    python -m translatorrr.daemon --workers 4 --port 8750
+
+Files dropped into ``input/`` are queued and translated by a pool of worker
+processes. The queue lives in SQLite, so a restarted daemon picks up where it
+stopped, and interrupted documents resume from their chunk checkpoints.
+
+    GET  /status            job counts and worker processes
+    GET  /jobs?status=...   recent jobs, optionally filtered by status
+    GET  /jobs/<id>         one job
+    POST /jobs              {"path": "...", "priority": 10} queues a file of the
+                            input folder, as application/json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from icecream import ic
+from pydantic_settings import BaseSettings
+
+from .jobs import JobQueue
+
+if TYPE_CHECKING:
+    from .llm import LLMSettings
+
+
+class DaemonSettings(BaseSettings):
+    input_folder: str = "input"
+    jobs_path: str = "jobs/jobs.db"
+    daemon_workers: int = 2
+    # seconds between scans of input_folder and idle polls of the queue
+    watch_interval: float = 2.0
+    watch_priority: int = 0
+    status_host: str = "127.0.0.1"
+    status_port: int = 8750
+    heartbeat_interval: float = 15
+    # running jobs without a heartbeat for this long are queued again
+    stale_after: float = 120
+    job_max_attempts: int = 3
+
+    class Config:
+        env_file = ".env"
+        extra = "ignore"
+
+
+def worker_llm_settings(workers: int) -> "LLMSettings":
+    """Give every worker process its share of the per-key quotas."""
+    from .llm import LLMSettings
+
+    settings = LLMSettings()
+    return settings.model_copy(
+        update=dict(
+            rpm_per_key=math.ceil(settings.rpm_per_key / workers),
+            tpm_per_key=math.ceil(settings.tpm_per_key / workers),
+        )
+    )
+
+
+def run_worker(name: str, settings: Dict, stop: threading.Event):
+    # the translation stack is only imported in the worker processes
+    from .llm import LLM
+    from .translator import Translator, TranslatorSettings
+
+    # the parent process owns shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    settings = DaemonSettings(**settings)
+    translator = Translator(
+        settings=TranslatorSettings(show_progress=False),
+        llm=LLM(settings=worker_llm_settings(settings.daemon_workers)),
+    )
+    queue = JobQueue(settings.jobs_path)
+    # every job runs in one event loop, so the LLM keeps its connections
+    loop = asyncio.new_event_loop()
+
+    while not stop.is_set():
+        job = queue.claim(name)
+        if job is None:
+            stop.wait(settings.watch_interval)
+            continue
+
+        ic(name, job.id, job.path)
+        beating = threading.Event()
+
+        def beat(job_id: int = job.id):
+            # sqlite connections stay in the thread that opened them
+            beats = JobQueue(settings.jobs_path)
+            while not beating.wait(settings.heartbeat_interval):
+                beats.heartbeat(job_id)
+            beats.close()
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        try:
+            if not os.path.exists(job.path):
+                raise FileNotFoundError(job.path)
+            if translator.targets:
+                outputs = loop.run_until_complete(
+                    translator.atranslate_file_to(job.path)
+                )
+                queue.complete(job.id, ", ".join(outputs.values()))
+            else:
+                output = loop.run_until_complete(translator.atranslate_file(job.path))
+                queue.complete(job.id, output)
+        except Exception as e:
+            ic(name, job.id, e)
+            queue.fail(job.id, repr(e), settings.job_max_attempts)
+        finally:
+            beating.set()
+            beater.join()
+
+    loop.run_until_complete(translator.llm.aclose())
+    loop.close()
+    queue.close()
+
+
+class Daemon:
+    def __init__(self, settings: Optional[DaemonSettings] = None):
+        self.settings = settings or DaemonSettings()
+        self.queue = JobQueue(self.settings.jobs_path)
+        self.started = time.time()
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._workers: Dict[str, multiprocessing.process.BaseProcess] = {}
+        self._seen: Dict[str, Tuple[int, float]] = {}
+        self._sizes: Dict[str, Tuple[int, float]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _start_worker(self, name: str):
+        process = self._context.Process(
+            target=run_worker,
+            args=(name, self.settings.model_dump(), self._stop),
+            name=name,
+            daemon=True,
+        )
+        process.start()
+        self._workers[name] = process
+
+    def scan(self):
+        """Queue files that stopped changing since the previous scan."""
+        folder = self.settings.input_folder
+        os.makedirs(folder, exist_ok=True)
+        sizes = {}
+        for name in os.listdir(folder):
+            path = os.path.abspath(os.path.join(folder, name))
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            sizes[path] = (stat.st_size, stat.st_mtime)
+            # a file still being written is picked up on a later scan
+            if self._sizes.get(path) != sizes[path]:
+                continue
+            if self._seen.get(path) != sizes[path]:
+                self.queue.submit(path, self.settings.watch_priority)
+                self._seen[path] = sizes[path]
+        self._sizes = sizes
+        self._seen = {path: seen for path, seen in self._seen.items() if path in sizes}
+
+    def supervise(self):
+        for name, process in list(self._workers.items()):
+            if not process.is_alive():
+                ic(f"{name} exited with {process.exitcode}, restarting")
+                self.queue.requeue_worker(name)
+                self._start_worker(name)
+        self.queue.requeue_stale(self.settings.stale_after)
+
+    def status(self, queue: JobQueue) -> Dict:
+        # sqlite connections can't cross threads, the caller brings its own
+        return {
+            "uptime": time.time() - self.started,
+            "jobs": queue.counts(),
+            "workers": [
+                {"name": name, "pid": process.pid, "alive": process.is_alive()}
+                for name, process in self._workers.items()
+            ],
+        }
+
+    def run(self):
+        requeued = self.queue.requeue_stale()
+        if requeued:
+            ic(f"resuming {requeued} interrupted jobs")
+        for i in range(self.settings.daemon_workers):
+            self._start_worker(f"worker-{i}")
+
+        self._server = ThreadingHTTPServer(
+            (self.settings.status_host, self.settings.status_port), self._handler()
+        )
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        ic(
+            f"status API on http://{self.settings.status_host}:{self.settings.status_port}"
+        )
+
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.set())
+        try:
+            while not stopping.wait(self.settings.watch_interval):
+                self.scan()
+                self.supervise()
+        finally:
+            self.shutdown()
+
+    def shutdown(self, timeout: float = 10):
+        """Stop the workers; unfinished jobs go back to the queue."""
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        deadline = time.time() + timeout
+        for name, process in self._workers.items():
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self.queue.requeue_worker(name)
+        self.queue.close()
+
+    def _handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                queue = JobQueue(daemon.settings.jobs_path)
+                try:
+                    if parts == ["status"]:
+                        self._send(200, daemon.status(queue))
+                    elif parts == ["jobs"]:
+                        query = parse_qs(url.query)
+                        jobs = queue.list(
+                            status=query.get("status", [None])[0],
+                            limit=int(query.get("limit", ["100"])[0]),
+                        )
+                        self._send(200, [job.to_dict() for job in jobs])
+                    elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                        job = queue.get(int(parts[1]))
+                        if job is None:
+                            self._send(404, {"error": "no such job"})
+                        else:
+                            self._send(200, job.to_dict())
+                    else:
+                        self._send(404, {"error": "not found"})
+                finally:
+                    queue.close()
+
+            def do_POST(self):
+                if urlparse(self.path).path.rstrip("/") != "/jobs":
+                    self._send(404, {"error": "not found"})
+                    return
+                # browsers send text/plain cross-origin without a preflight
+                content_type = self.headers.get("content-type", "")
+                if content_type.split(";")[0].strip() != "application/json":
+                    self._send(415, {"error": "expected application/json"})
+                    return
+                try:
+                    length = int(self.headers.get("content-length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    path = request["path"]
+                    priority = int(request.get("priority", 0))
+                except (KeyError, ValueError) as e:
+                    self._send(400, {"error": repr(e)})
+                    return
+                # translated sources are deleted, only input_folder's files qualify
+                path = os.path.realpath(path)
+                folder = os.path.realpath(daemon.settings.input_folder)
+                if os.path.commonpath([path, folder]) != folder:
+                    self._send(403, {"error": f"not in {folder}: {path}"})
+                    return
+                if not os.path.isfile(path):
+                    self._send(400, {"error": f"no such file: {path}"})
+                    return
+                queue = JobQueue(daemon.settings.jobs_path)
+                try:
+                    self._send(201, {"id": queue.submit(path, priority)})
+                finally:
+                    queue.close()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--input", help="folder to watch")
+    args = parser.parse_args()
+
+    overrides = dict(
+        daemon_workers=args.workers, status_port=args.port, input_folder=args.input
+    )
+    Daemon(
+        DaemonSettings(**{k: v for k, v in overrides.items() if v is not None})
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
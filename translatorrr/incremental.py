@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .chunker import Chunk, split_oversized
+from .utils import calculate_chunk_size
+
+STATE_VERSION = 1
+
+
+def block_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class ChunkState:
+    blocks: List[str]
+    translation: str
+
+
+@dataclass
+class DocumentState:
+    """What an incremental run keeps next to the output of one document.
+
+    Every chunk stores the hashes of the source blocks it was built from and
+    its final translation, both with masked spans restored so placeholder
+    numbering does not leak into the comparison.
+    """
+
+    output_path: str = ""
+    chunks: List[ChunkState] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["DocumentState"]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("version") != STATE_VERSION:
+            return None
+        return cls(
+            output_path=data.get("output_path", ""),
+            chunks=[ChunkState(**chunk) for chunk in data["chunks"]],
+        )
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                dict(version=STATE_VERSION, **asdict(self)), f, ensure_ascii=False
+            )
+        os.replace(tmp_path, path)
+
+
+def _join(pieces: List[Tuple[int, str, int]]) -> Chunk:
+    text = "".join(piece for _, piece, _ in pieces)
+    start = pieces[0][0]
+    return Chunk(text, start, start + len(text), sum(t for _, _, t in pieces))
+
+
+@dataclass
+class ChunkPlan:
+    chunks: List[Chunk]
+    # block hashes of every chunk, saved for the next run
+    block_hashes: List[List[str]]
+    # translations carried over from the previous run by chunk index
+    reused: Dict[int, str]
+
+
+def plan_chunks(
+    blocks: List[Tuple[int, str, int]],
+    token_limit: int,
+    previous: Optional[DocumentState] = None,
+    restore: Callable[[str], str] = lambda text: text,
+) -> ChunkPlan:
+    """Chunk a document so that unchanged chunks of ``previous`` survive.
+
+    Blocks are aligned against the previous run with a diff. A previous chunk
+    whose blocks all reappear in order becomes a chunk again and keeps its
+    translation, unless it borders a changed chunk. The new or edited blocks
+    in between are packed into fresh chunks.
+    """
+    token_count = sum(tokens for _, _, tokens in blocks)
+    chunk_size = calculate_chunk_size(token_count, token_limit) if token_count else 1
+    pieces = list(split_oversized(blocks, chunk_size))
+    hashes = [block_hash(restore(text)) for _, text, _ in pieces]
+
+    old_chunks = previous.chunks if previous else []
+    old_hashes = [h for chunk in old_chunks for h in chunk.blocks]
+    # position of each old block, and where every old chunk starts
+    starts: Dict[int, int] = {}
+    pos = 0
+    for idx, chunk in enumerate(old_chunks):
+        starts[pos] = idx
+        pos += len(chunk.blocks)
+
+    mapping: Dict[int, int] = {}
+    matcher = SequenceMatcher(None, old_hashes, hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            mapping.update(zip(range(j1, j2), range(i1, i2)))
+
+    chunks: List[Chunk] = []
+    block_hashes: List[List[str]] = []
+    reused: Dict[int, str] = {}
+    pending: List[int] = []
+
+    def add(run: List[int]):
+        chunks.append(_join([pieces[k] for k in run]))
+        block_hashes.append([hashes[k] for k in run])
+
+    def flush():
+        # new and edited blocks are packed evenly, like a fresh document
+        run_tokens = sum(pieces[k][2] for k in pending)
+        size = calculate_chunk_size(run_tokens, token_limit) if run_tokens else 1
+        group: List[int] = []
+        group_tokens = 0
+        for k in pending:
+            if group and group_tokens + pieces[k][2] > size:
+                add(group)
+                group, group_tokens = [], 0
+            group.append(k)
+            group_tokens += pieces[k][2]
+        if group:
+            add(group)
+        pending.clear()
+
+    j = 0
+    while j < len(pieces):
+        old = mapping.get(j)
+        old_idx = starts.get(old) if old is not None else None
+        if old_idx is not None:
+            size = len(old_chunks[old_idx].blocks)
+            if all(mapping.get(j + k) == old + k for k in range(size)):
+                flush()
+                reused[len(chunks)] = old_chunks[old_idx].translation
+                add(list(range(j, j + size)))
+                j += size
+                continue
+        pending.append(j)
+        j += 1
+    flush()
+
+    # chunks next to a change lose their translation, their context changed
+    changed: Set[int] = set(range(len(chunks))) - set(reused)
+    for i in changed:
+        reused.pop(i - 1, None)
+        reused.pop(i + 1, None)
+
+    return ChunkPlan(chunks=chunks, block_hashes=block_hashes, reused=reused)
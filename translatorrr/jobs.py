@@ -0,0 +1,179 @@
+import os
+import sqlite3
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: int
+    path: str
+    priority: int
+    status: str
+    attempts: int
+    worker: Optional[str]
+    output: Optional[str]
+    error: Optional[str]
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+    heartbeat: Optional[float]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class JobQueue:
+    """Persistent priority queue of documents to translate.
+
+    Several worker processes may share one database file; ``claim`` hands
+    every queued job to exactly one of them, highest priority first, then
+    oldest first. Jobs whose worker stopped sending heartbeats go back to the
+    queue, and their chunk checkpoints let the next worker resume them.
+    """
+
+    def __init__(self, path: str = "jobs/jobs.db"):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                output TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                started REAL,
+                finished REAL,
+                heartbeat REAL
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id)"
+        )
+
+    def submit(self, path: str, priority: int = 0) -> int:
+        """Queue ``path``; a path already queued or running keeps its job."""
+        path = os.path.abspath(path)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT id, priority FROM jobs WHERE path = ? AND status IN (?, ?)",
+                (path, QUEUED, RUNNING),
+            ).fetchone()
+            if row is not None:
+                if priority > row["priority"]:
+                    self.conn.execute(
+                        "UPDATE jobs SET priority = ? WHERE id = ?",
+                        (priority, row["id"]),
+                    )
+                job_id = row["id"]
+            else:
+                job_id = self.conn.execute(
+                    "INSERT INTO jobs (path, priority, status, created)"
+                    " VALUES (?, ?, ?, ?)",
+                    (path, priority, QUEUED, time.time()),
+                ).lastrowid
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Job]:
+        now = time.time()
+        rows = self.conn.execute(
+            """UPDATE jobs
+            SET status = ?, worker = ?, attempts = attempts + 1,
+                started = ?, heartbeat = ?
+            WHERE id = (
+                SELECT id FROM jobs WHERE status = ?
+                ORDER BY priority DESC, id LIMIT 1
+            )
+            RETURNING *""",
+            (RUNNING, worker, now, now, QUEUED),
+        ).fetchall()
+        return Job(**rows[0]) if rows else None
+
+    def heartbeat(self, job_id: int):
+        self.conn.execute(
+            "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = ?",
+            (time.time(), job_id, RUNNING),
+        )
+
+    def complete(self, job_id: int, output: str):
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, output = ?, error = NULL, finished = ?"
+            " WHERE id = ?",
+            (DONE, output, time.time(), job_id),
+        )
+
+    def fail(self, job_id: int, error: str, max_attempts: int = 3):
+        """Record a failure, the job is queued again until ``max_attempts``."""
+        self.conn.execute(
+            """UPDATE jobs
+            SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,
+                error = ?, finished = ?
+            WHERE id = ?""",
+            (max_attempts, QUEUED, FAILED, error, time.time(), job_id),
+        )
+
+    def requeue_stale(self, older_than: float = 0) -> int:
+        """Queue running jobs again whose last heartbeat is too old.
+
+        The default requeues every running job, for a restart after a crash.
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL"
+            " WHERE status = ? AND heartbeat < ?",
+            (QUEUED, RUNNING, time.time() - older_than),
+        )
+        return cursor.rowcount
+
+    def requeue_worker(self, worker: str) -> int:
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL"
+            " WHERE status = ? AND worker = ?",
+            (QUEUED, RUNNING, worker),
+        )
+        return cursor.rowcount
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+        if status:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ?"
+                " ORDER BY priority DESC, id DESC LIMIT ?",
+                (status, limit),
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            )
+        return [Job(**row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for status, count in self.conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,187 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import openai
+
+
+@dataclass
+class TokenBucket:
+    """Refilling budget, ``capacity`` of 0 means unlimited."""
+
+    capacity: float
+    refill_per_second: float
+    tokens: float = field(init=False)
+    updated: float = field(init=False)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, limit: float) -> "TokenBucket":
+        return cls(capacity=limit, refill_per_second=limit / 60)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.refill_per_second,
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        # a single request larger than the bucket only waits for a full bucket
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        if self.capacity <= 0:
+            return
+        self._refill()
+        self.tokens -= amount
+
+
+@dataclass
+class KeyState:
+    key: str
+    base_url: str
+    client: openai.Client
+    requests: TokenBucket
+    tokens: TokenBucket
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    _async_client: Optional[openai.AsyncClient] = field(init=False, default=None)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(init=False, default=None)
+
+    @property
+    def async_client(self) -> openai.AsyncClient:
+        # pooled connections belong to the loop that opened them, a client
+        # kept from a finished run fails with "Event loop is closed"
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            # openai clients retry 429s on the same key by themselves, the
+            # pool moves on to another key instead
+            self._async_client = openai.AsyncClient(
+                api_key=self.key, base_url=self.base_url, max_retries=0
+            )
+        return self._async_client
+
+    async def aclose(self):
+        """Close the connections opened in the running loop."""
+        client, self._async_client = self._async_client, None
+        if client is not None and self._loop is asyncio.get_running_loop():
+            await client.close()
+        self._loop = None
+
+    @property
+    def label(self) -> str:
+        return f"...{self.key[-4:]}"
+
+    def wait_time(self, tokens: float) -> float:
+        return max(
+            self.cooldown_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens),
+            0.0,
+        )
+
+
+class KeyPool:
+    """Spreads requests over API keys while respecting per-key quotas."""
+
+    strategies = ("round_robin", "least_loaded")
+
+    def __init__(
+        self,
+        keys: List[str],
+        base_url: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        strategy: str = "least_loaded",
+        cooldown: float = 60,
+    ):
+        if not keys:
+            raise ValueError("KeyPool needs at least one api key")
+        if strategy not in self.strategies:
+            raise ValueError(f"Unsupported key strategy: {strategy}")
+
+        self.strategy = strategy
+        self.cooldown_seconds = cooldown
+        self.keys = [
+            KeyState(
+                key=key,
+                base_url=base_url,
+                client=openai.Client(api_key=key, base_url=base_url),
+                requests=TokenBucket.per_minute(rpm),
+                tokens=TokenBucket.per_minute(tpm),
+            )
+            for key in keys
+        ]
+        self._cursor = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    async def aclose(self):
+        await asyncio.gather(*(state.aclose() for state in self.keys))
+
+    def _rotate(self) -> List[KeyState]:
+        ordered = self.keys[self._cursor :] + self.keys[: self._cursor]
+        self._cursor = (self._cursor + 1) % len(self.keys)
+        return ordered
+
+    def _choose(self, tokens: float) -> KeyState:
+        candidates = self._rotate()
+        if self.strategy == "round_robin":
+            return min(candidates, key=lambda state: state.wait_time(tokens))
+        return min(
+            candidates,
+            key=lambda state: (state.wait_time(tokens), state.in_flight),
+        )
+
+    def next(self) -> KeyState:
+        """Pick a key without waiting, for synchronous callers."""
+        return self._choose(0)
+
+    async def acquire(self, tokens: float = 0) -> KeyState:
+        while True:
+            state = self._choose(tokens)
+            delay = state.wait_time(tokens)
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        state.requests.consume(1)
+        state.tokens.consume(tokens)
+        state.in_flight += 1
+        return state
+
+    def release(
+        self,
+        state: KeyState,
+        estimated_tokens: float = 0,
+        used_tokens: Optional[float] = None,
+    ):
+        state.in_flight -= 1
+        if used_tokens is not None:
+            state.tokens.consume(used_tokens - estimated_tokens)
+
+    def cooldown(self, state: KeyState, seconds: Optional[float] = None):
+        seconds = self.cooldown_seconds if seconds is None else seconds
+        state.cooldown_until = max(state.cooldown_until, time.monotonic() + seconds)
+
+
+def retry_after(error: openai.APIStatusError) -> Optional[float]:
+    value = error.response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -1,12 +1,33 @@
+import asyncio
 import random
+import time
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
 
-import ell
 import openai
+from icecream import ic
 from pydantic_settings import BaseSettings
 
-from .utils import remove_translation_tags
+from .keypool import KeyPool, KeyState, retry_after
+from .prompt import Prompt
+from .utils import (
+    TranslationTagStripper,
+    num_tokens_in_string,
+    remove_translation_tags,
+)
+
+T = TypeVar("T")
 
 PLATFORM_MAP = {
     "gemini": {
@@ -17,9 +38,17 @@ PLATFORM_MAP = {
             "gemini-1.5-flash-001",
             "gemini-1.5-flash-8b",
         ],
+        # cheaper model to fall back to after repeated failures
+        "failover": {
+            "gemini-1.5-pro-002": "gemini-1.5-flash-002",
+            "gemini-1.5-pro-001": "gemini-1.5-flash-001",
+            "gemini-1.5-flash-002": "gemini-1.5-flash-8b",
+            "gemini-1.5-flash-001": "gemini-1.5-flash-8b",
+        },
     },
     "openai": {
         "models": ["gpt-4o", "gpt-4o-mini"],
+        "failover": {"gpt-4o": "gpt-4o-mini"},
     },
     # "claude": {
     #     "models": ["claude-3-haiku", "claude-3-5-sonnet", "claude-3-opus"],
@@ -35,6 +64,27 @@ class LLMSettings(BaseSettings):
     # claude_api_keys: Optional[str] = None
     # claude_base_url: str
     mission_model: str
+    max_concurrency: int = 8
+    key_strategy: Literal["round_robin", "least_loaded"] = "least_loaded"
+    # per-key quotas, 0 disables the limit
+    rpm_per_key: int = 0
+    tpm_per_key: int = 0
+    key_cooldown: float = 60
+    stream: bool = True
+    # retries after the first attempt, with exponential backoff and full jitter
+    max_retries: int = 4
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 30.0
+    # deadline for a single attempt in seconds, 0 disables
+    call_timeout: float = 300
+    # send a duplicate request once a call outlives this latency percentile of
+    # recent calls, 0 disables
+    hedge_percentile: float = 0
+    hedge_min_samples: int = 20
+    # consecutive timeouts, connection and server errors before switching to the
+    # failover model, 0 disables; 429s only cool their key down
+    failover_after: int = 3
+    failover_duration: float = 300
 
     class Config:
         env_file = ".env"
@@ -54,32 +104,392 @@ class LLMSettings(BaseSettings):
                 return platform
         raise ValueError(f"Unsupported model: {self.mission_model}")
 
-    def pick_key_and_url(self):
+    def get_failover_model(self, model: str) -> Optional[str]:
+        return PLATFORM_MAP[self.get_platform()].get("failover", {}).get(model)
+
+    def get_keys_and_url(self):
         platform = self.get_platform()
         api_keys = self.get_api_keys(platform)
         base_url = getattr(self, f"{platform}_base_url")
-        return random.choice(api_keys), base_url
+        return api_keys, base_url
+
+    def build_key_pool(self) -> KeyPool:
+        api_keys, base_url = self.get_keys_and_url()
+        return KeyPool(
+            api_keys,
+            base_url,
+            rpm=self.rpm_per_key,
+            tpm=self.tpm_per_key,
+            strategy=self.key_strategy,
+            cooldown=self.key_cooldown,
+        )
+
+
+def prompt_messages(prompt: Union[str, Prompt]) -> List[Dict[str, str]]:
+    # the system prefix goes first and alone so providers can cache it
+    if isinstance(prompt, Prompt):
+        return [
+            {"role": "system", "content": prompt.system},
+            {"role": "user", "content": prompt.user},
+        ]
+    return [{"role": "user", "content": prompt}]
+
+
+def cached_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+class GenerationCancelled(Exception):
+    """A streamed generation was stopped before it finished."""
+
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+@dataclass
+class Completion:
+    text: str
+    key: str
+    model: str
+    prompt_tokens: int = 0
+    # prompt tokens the provider served from its prefix cache
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    time_to_first_token: Optional[float] = None
+    retries: int = 0
+    hedged: bool = False
+    # chunks answered together by this request
+    batch_size: int = 1
+
+    @property
+    def tokens_per_second(self) -> float:
+        generating = self.latency - (self.time_to_first_token or 0.0)
+        return self.completion_tokens / generating if generating > 0 else 0.0
 
 
 @dataclass
 class LLM:
     settings: LLMSettings = field(default_factory=LLMSettings)
-    key: str = field(init=False)
-    base_url: str = field(init=False)
-    client: openai.Client = field(init=False)
-
-    def __post_init__(self):
-        self.key, self.base_url = self.settings.pick_key_and_url()
-        self.client = openai.Client(api_key=self.key, base_url=self.base_url)
-
-    def do(self, prompt: str):
-        @ell.simple(
-            model=self.settings.mission_model,
-            client=self.client,
+    usage: Dict[str, int] = field(
+        init=False,
+        default_factory=lambda: dict(
+            calls=0, prompt_tokens=0, cached_tokens=0, completion_tokens=0
+        ),
+    )
+    recent_calls: Deque[Completion] = field(
+        init=False, default_factory=lambda: deque(maxlen=1000)
+    )
+    _semaphore: Optional[asyncio.Semaphore] = field(init=False, default=None)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(init=False, default=None)
+    _failures: int = field(init=False, default=0)
+    _failover_model: Optional[str] = field(init=False, default=None)
+    _failover_until: float = field(init=False, default=0.0)
+    _pool: Optional[KeyPool] = field(init=False, default=None)
+
+    @property
+    def pool(self) -> KeyPool:
+        # clients are built when the first call needs them
+        if self._pool is None:
+            self._pool = self.settings.build_key_pool()
+        return self._pool
+
+    def _limiter(self) -> asyncio.Semaphore:
+        # asyncio primitives are bound to one loop, rebuild when a new run starts
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.settings.max_concurrency)
+        return self._semaphore
+
+    @property
+    def model(self) -> str:
+        """The model calls go to, the failover model while one is active."""
+        if self._failover_model and time.monotonic() < self._failover_until:
+            return self._failover_model
+        self._failover_model = None
+        return self.settings.mission_model
+
+    async def aclose(self):
+        """Close the HTTP connections opened in the running event loop."""
+        if self._pool is not None:
+            await self._pool.aclose()
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """``asyncio.run`` that closes this LLM's connections before the loop ends."""
+
+        async def main() -> T:
+            try:
+                return await coroutine
+            finally:
+                await self.aclose()
+
+        return asyncio.run(main())
+
+    def _succeeded(self):
+        self._failures = 0
+
+    def _failed(self):
+        self._failures += 1
+        if not self.settings.failover_after:
+            return
+        if self._failures < self.settings.failover_after:
+            return
+        fallback = self.settings.get_failover_model(self.model)
+        if fallback:
+            ic(f"{self.model} failed {self._failures} times, switching to {fallback}")
+            self._failover_model = fallback
+            self._failover_until = time.monotonic() + self.settings.failover_duration
+        self._failures = 0
+
+    def _backoff(self, attempt: int) -> float:
+        delay = self.settings.retry_base_delay * 2**attempt
+        return random.uniform(0, min(self.settings.retry_max_delay, delay))
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.settings.hedge_percentile:
+            return None
+        latencies = sorted(c.latency for c in self.recent_calls if not c.hedged)
+        if len(latencies) < max(1, self.settings.hedge_min_samples):
+            return None
+        rank = int(len(latencies) * self.settings.hedge_percentile / 100)
+        return latencies[min(rank, len(latencies) - 1)]
+
+    def do(self, prompt: Union[str, Prompt]):
+        # ell takes seconds to import and only this synchronous path needs it
+        import ell
+
+        for attempt in range(self.settings.max_retries + 1):
+            key = self.pool.next()
+            client = key.client
+            if self.settings.call_timeout:
+                client = client.with_options(timeout=self.settings.call_timeout)
+
+            @ell.simple(model=self.model, client=client, temperature=1, top_p=0.95)
+            def _do():
+                if isinstance(prompt, Prompt):
+                    return [ell.system(prompt.system), ell.user(prompt.user)]
+                return prompt
+
+            try:
+                result = _do()
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.pool.cooldown(key, retry_after(e))
+                else:
+                    self._failed()
+                if attempt == self.settings.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            self._succeeded()
+            return remove_translation_tags(result)
+
+    async def acall(
+        self,
+        prompt: Union[str, Prompt],
+        on_delta: Optional[Callable[[Optional[str]], None]] = None,
+        max_output_tokens: Optional[int] = None,
+        retry_cancelled: bool = False,
+    ) -> Completion:
+        """Run one completion, streaming it unless ``settings.stream`` is off.
+
+        ``on_delta`` receives the tag-stripped text as it arrives, and a stream
+        producing more than ``max_output_tokens`` raises GenerationCancelled,
+        or is sampled again with ``retry_cancelled``.
+        Timeouts, 429s, connection and server errors are retried with backoff.
+        ``on_delta(None)`` means the text received so far is void: a retry
+        starts over, or a hedge won and its whole text follows in one delta.
+        """
+        estimated_tokens = num_tokens_in_string(
+            prompt.text if isinstance(prompt, Prompt) else prompt
+        )
+        streamed = False
+
+        def forward(text: Optional[str]):
+            nonlocal streamed
+            streamed = True
+            on_delta(text)
+
+        async with self._limiter():
+            for attempt in range(self.settings.max_retries + 1):
+                if streamed:
+                    on_delta(None)
+                    streamed = False
+                try:
+                    completion = await self._hedged(
+                        prompt,
+                        forward if on_delta else None,
+                        max_output_tokens,
+                        estimated_tokens,
+                    )
+                except GenerationCancelled:
+                    # a runaway sample says nothing about the model's health
+                    if not retry_cancelled or attempt == self.settings.max_retries:
+                        raise
+                    continue
+                except RETRYABLE_ERRORS as e:
+                    # a 429 is quota, not an unhealthy model, and must not fail over
+                    if not isinstance(e, openai.RateLimitError):
+                        self._failed()
+                    if attempt == self.settings.max_retries:
+                        raise
+                    # a 429 already cooled its key down, another key can go now
+                    if not isinstance(e, openai.RateLimitError):
+                        await asyncio.sleep(self._backoff(attempt))
+                    continue
+                self._succeeded()
+                completion.retries = attempt
+                break
+
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += completion.prompt_tokens
+        self.usage["cached_tokens"] += completion.cached_tokens
+        self.usage["completion_tokens"] += completion.completion_tokens
+        self.recent_calls.append(completion)
+        return completion
+
+    async def _hedged(
+        self,
+        prompt: Union[str, Prompt],
+        on_delta: Optional[Callable[[Optional[str]], None]],
+        max_output_tokens: Optional[int],
+        estimated_tokens: int,
+    ) -> Completion:
+        """Race a duplicate request on another key against a slow one.
+
+        Only the first request reports deltas, the duplicate runs silently and
+        replaces them with its whole text when it wins.
+        """
+        primary = asyncio.ensure_future(
+            self._attempt(prompt, on_delta, max_output_tokens, estimated_tokens)
+        )
+        delay = self._hedge_delay()
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(
+            self._attempt(prompt, None, max_output_tokens, estimated_tokens)
+        )
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        completion = task.result()
+                        completion.hedged = task is hedge
+                        if completion.hedged and on_delta:
+                            on_delta(None)
+                            on_delta(completion.text)
+                        return completion
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _attempt(
+        self,
+        prompt: Union[str, Prompt],
+        on_delta: Optional[Callable[[str], None]],
+        max_output_tokens: Optional[int],
+        estimated_tokens: int,
+    ) -> Completion:
+        key = await self.pool.acquire(estimated_tokens)
+        completion = None
+        try:
+            request = self._complete(key, prompt, on_delta, max_output_tokens)
+            if self.settings.call_timeout:
+                request = asyncio.wait_for(request, self.settings.call_timeout)
+            completion = await request
+            return completion
+        except openai.RateLimitError as e:
+            self.pool.cooldown(key, retry_after(e))
+            raise
+        finally:
+            used_tokens = None
+            if completion and completion.prompt_tokens:
+                used_tokens = completion.prompt_tokens + completion.completion_tokens
+            self.pool.release(key, estimated_tokens, used_tokens)
+
+    async def _complete(
+        self,
+        key: KeyState,
+        prompt: Union[str, Prompt],
+        on_delta: Optional[Callable[[str], None]],
+        max_output_tokens: Optional[int],
+    ) -> Completion:
+        start = time.perf_counter()
+        model = self.model
+        completion = Completion(text="", key=key.label, model=model)
+        request = dict(
+            model=model,
+            messages=prompt_messages(prompt),
             temperature=1,
             top_p=0.95,
         )
-        def _do():
-            return prompt
 
-        return remove_translation_tags(_do())
+        if not self.settings.stream:
+            response = await key.async_client.chat.completions.create(**request)
+            completion.text = remove_translation_tags(
+                response.choices[0].message.content or ""
+            )
+            if response.usage:
+                completion.prompt_tokens = response.usage.prompt_tokens
+                completion.cached_tokens = cached_tokens(response.usage)
+                completion.completion_tokens = response.usage.completion_tokens
+            completion.latency = time.perf_counter() - start
+            return completion
+
+        stripper = TranslationTagStripper()
+        parts = []
+        streamed_tokens = 0
+
+        def emit(text: str):
+            if text:
+                parts.append(text)
+                if on_delta:
+                    on_delta(text)
+
+        stream = await key.async_client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            async for event in stream:
+                if event.usage:
+                    completion.prompt_tokens = event.usage.prompt_tokens
+                    completion.cached_tokens = cached_tokens(event.usage)
+                    completion.completion_tokens = event.usage.completion_tokens
+                if not event.choices or not event.choices[0].delta.content:
+                    continue
+
+                delta = event.choices[0].delta.content
+                if completion.time_to_first_token is None:
+                    completion.time_to_first_token = time.perf_counter() - start
+                streamed_tokens += num_tokens_in_string(delta)
+                if max_output_tokens and streamed_tokens > max_output_tokens:
+                    raise GenerationCancelled(
+                        f"output passed {max_output_tokens} tokens"
+                    )
+                emit(stripper.feed(delta))
+        finally:
+            await stream.close()
+
+        emit(stripper.finish())
+        completion.text = "".join(parts)
+        completion.completion_tokens = completion.completion_tokens or streamed_tokens
+        completion.latency = time.perf_counter() - start
+        return completion
@@ -0,0 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+import regex as re
+
+PLACEHOLDER = "@@{}@@"
+PLACEHOLDER_PATTERN = re.compile(r"@@\s*(\d+)\s*@@")
+
+# Spans the model only has to copy through, earlier alternatives win.
+MASK_PATTERN = re.compile(
+    r"(?ms:^(?P<fence>`{3,}|~{3,})[^\n]*\n.*?^(?P=fence)[ \t]*$)"
+    r"|(?s:\$\$.+?\$\$)"
+    r"|(?s:\\\[.+?\\\])"
+    r"|(?s:\\\(.+?\\\))"
+    r"|`[^`\n]+`"
+    r"|!\[[^\]\n]*\]\([^)\n]*\)"
+    r"|(?<![\\$])\$(?![\s$])[^$\n]+?(?<![\s\\])\$"
+    r"|(?<=\]\()[^)\n]+(?=\))"
+    r"|<?https?://[^\s)\]>]*[^\s)\]>.,;:!?]>?"
+)
+
+
+@dataclass
+class MaskedText:
+    text: str
+    spans: List[str] = field(default_factory=list)
+
+    def restore(self, text: str) -> str:
+        def replacer(match):
+            idx = int(match.group(1))
+            return self.spans[idx] if idx < len(self.spans) else match.group(0)
+
+        return PLACEHOLDER_PATTERN.sub(replacer, text)
+
+
+class StreamMasker:
+    """Masks spans the model only has to copy, numbering placeholders per chunk.
+
+    Text is masked with document-wide placeholder numbers, whole or block by
+    block; ``take`` then renumbers the placeholders of one chunk from zero and
+    moves their spans into the chunk's own ``MaskedText``, so only spans of
+    chunks that were not taken yet are held, and a chunk reads the same
+    wherever it sits in the document.
+    """
+
+    def __init__(self):
+        self._spans: Dict[int, str] = {}
+        self._count = 0
+
+    def mask(self, text: str) -> str:
+        def replacer(match):
+            self._spans[self._count] = match.group(0)
+            self._count += 1
+            return PLACEHOLDER.format(self._count - 1)
+
+        return MASK_PATTERN.sub(replacer, text)
+
+    def restore(self, text: str) -> str:
+        """Restore document-wide placeholders of spans not taken yet."""
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: self._spans.get(int(match.group(1)), match.group(0)), text
+        )
+
+    def take(self, text: str) -> MaskedText:
+        masked = MaskedText(text="")
+
+        def replacer(match):
+            span = self._spans.pop(int(match.group(1)), None)
+            if span is None:
+                return match.group(0)
+            masked.spans.append(span)
+            return PLACEHOLDER.format(len(masked.spans) - 1)
+
+        masked.text = PLACEHOLDER_PATTERN.sub(replacer, text)
+        return masked
+
+
+def placeholders_in(text: str) -> Set[int]:
+    return {int(idx) for idx in PLACEHOLDER_PATTERN.findall(text)}
+
+
+def ensure_placeholders(source: str, translation: str, fallback: str = "") -> str:
+    """Make sure every placeholder of ``source`` survives the translation.
+
+    Prefers ``translation``, then ``fallback``; when both dropped some, the
+    missing placeholders are appended so no masked content is lost.
+    """
+    expected = placeholders_in(source)
+    missing = expected - placeholders_in(translation)
+    if not missing:
+        return translation
+    if fallback and not expected - placeholders_in(fallback):
+        return fallback
+    return translation + "\n\n" + "\n\n".join(
+        PLACEHOLDER.format(idx) for idx in sorted(missing)
+    )
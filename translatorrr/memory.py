@@ -0,0 +1,165 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+# puts between recounts of the stored size, other processes write too
+RECOUNT_EVERY = 1000
+
+
+class TranslationMemory:
+    """Content-addressed store of LLM outputs shared by every document.
+
+    Entries are keyed by a hash of the chunk text, language pair, model, stage
+    and whatever else the output depends on (the rendered prompt), and evicted
+    least-recently-used once the stored text exceeds ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        path: str = "memory/translation_memory.db",
+        max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # running total of stored bytes, counted when the database opens
+        self._size = 0
+        self._puts = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # the database is opened on first use
+        if self._conn is None:
+            self._conn = self._connect()
+            self._size = self._count()
+        return self._conn
+
+    def _connect(self) -> sqlite3.Connection:
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_used REAL NOT NULL
+            )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def make_key(
+        stage: str,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        context: str = "",
+    ) -> str:
+        digest = hashlib.sha256()
+        for part in (stage, model, source_lang, target_lang, text, context):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x1f")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute(
+            "UPDATE entries SET hits = hits + 1, last_used = ? WHERE key = ?",
+            (time.time(), key),
+        )
+        self.conn.commit()
+        return row[0]
+
+    def put(self, key: str, stage: str, value: str):
+        size = len(value.encode("utf-8"))
+        replaced = self.conn.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, stage, value, size, last_used)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, stage, value, size, time.time()),
+        )
+        self.conn.commit()
+        self._size += size - (replaced[0] if replaced else 0)
+        self._puts += 1
+        if self._puts % RECOUNT_EVERY == 0:
+            self._size = self._count()
+        self._evict()
+
+    def size(self) -> int:
+        # opening the database counts what is already stored
+        return self._size if self._conn is not None else self._count()
+
+    def _count(self) -> int:
+        (total,) = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        return total
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        # the running total only knows this process's writes
+        self._size = self._count()
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+
+        stale = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ):
+            stale.append((key,))
+            self._size -= size
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        self.conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        entries, stored_bytes, stored_hits = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0)"
+            " FROM entries"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": stored_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "lifetime_hits": stored_hits,
+        }
+
+    def clear(self):
+        self.conn.execute("DELETE FROM entries")
+        self.conn.commit()
+        self._size = 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
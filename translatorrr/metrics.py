@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+@dataclass
+class CallRecord:
+    stage: str
+    chunk_index: int
+    model: str
+    key: Optional[str] = None
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    time_to_first_token: Optional[float] = None
+    retries: int = 0
+    hedged: bool = False
+    batch_size: int = 1
+    cache_hit: bool = False
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class _Totals:
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    hedges: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+
+
+class Metrics:
+    """Collects one ``CallRecord`` per stage call.
+
+    Records are appended to ``jsonl_path`` when given, aggregated for a
+    Prometheus text snapshot and passed to every registered hook, e.g. to
+    forward them to a tracing backend.
+    """
+
+    def __init__(self, jsonl_path: str = ""):
+        self.jsonl_path = jsonl_path
+        self.hooks: List[Callable[[CallRecord], None]] = []
+        self._file: Optional[TextIO] = None
+        self._totals: Dict[Tuple[str, str, str, str], _Totals] = defaultdict(_Totals)
+        self._buckets: Dict[str, List[int]] = defaultdict(
+            lambda: [0] * len(LATENCY_BUCKETS)
+        )
+        self._latency: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+        self._first_token: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+
+    def add_hook(self, hook: Callable[[CallRecord], None]):
+        self.hooks.append(hook)
+
+    def record(self, record: CallRecord):
+        cache = "hit" if record.cache_hit else "miss"
+        totals = self._totals[(record.stage, record.key or "", record.model, cache)]
+        totals.calls += 1
+        totals.errors += record.error is not None
+        totals.retries += record.retries
+        totals.hedges += record.hedged
+        totals.prompt_tokens += record.prompt_tokens
+        totals.cached_tokens += record.cached_tokens
+        totals.completion_tokens += record.completion_tokens
+        totals.latency += record.latency
+
+        if not record.cache_hit and record.error is None:
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if record.latency <= bound:
+                    self._buckets[record.stage][i] += 1
+            self._latency[record.stage][0] += record.latency
+            self._latency[record.stage][1] += 1
+            if record.time_to_first_token is not None:
+                self._first_token[record.stage][0] += record.time_to_first_token
+                self._first_token[record.stage][1] += 1
+
+        if self.jsonl_path:
+            if self._file is None:
+                dirname = os.path.dirname(self.jsonl_path)
+                if dirname:
+                    os.makedirs(dirname, exist_ok=True)
+                self._file = open(self.jsonl_path, "a", encoding="utf-8")
+            self._file.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+            self._file.flush()
+
+        for hook in self.hooks:
+            hook(record)
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        counters = [
+            ("calls", "Stage calls, cache hits included."),
+            ("errors", "Stage calls that failed."),
+            ("retries", "Retries spent inside stage calls."),
+            ("hedges", "Stage calls answered by a hedged duplicate request."),
+            ("prompt_tokens", "Prompt tokens sent to the LLM."),
+            ("cached_tokens", "Prompt tokens served from the provider prefix cache."),
+            ("completion_tokens", "Completion tokens received from the LLM."),
+            ("latency", "Seconds spent in stage calls."),
+        ]
+        for attr, help_text in counters:
+            suffix = "seconds_total" if attr == "latency" else "total"
+            name = f"translatorrr_{attr}_{suffix}"
+            family(name, "counter", help_text)
+            for (stage, key, model, cache), totals in sorted(self._totals.items()):
+                labels = (
+                    f'stage="{stage}",key="{key}",model="{model}",cache="{cache}"'
+                )
+                lines.append(f"{name}{{{labels}}} {getattr(totals, attr)}")
+
+        name = "translatorrr_llm_latency_seconds"
+        family(name, "histogram", "Latency of LLM calls by stage.")
+        for stage, buckets in sorted(self._buckets.items()):
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            total, count = self._latency[stage]
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        name = "translatorrr_time_to_first_token_seconds"
+        family(name, "summary", "Time to first streamed token by stage.")
+        for stage, (total, count) in sorted(self._first_token.items()):
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set
+
+import regex as re
+from icecream import ic
+
+from .llm import LLM, Completion
+from .masking import placeholders_in
+from .prompt import Prompt
+
+PART_PATTERN = re.compile(r"<PART (\d+)>\n?(.*?)\n?</PART \1>", re.S)
+
+
+def format_parts(texts: List[str]) -> str:
+    return "\n".join(
+        f"<PART {n}>\n{text}\n</PART {n}>" for n, text in enumerate(texts, 1)
+    )
+
+
+def parse_parts(text: str) -> Dict[int, str]:
+    """Split a batched reply back into its parts by number."""
+    parts: Dict[int, str] = {}
+    for match in PART_PATTERN.finditer(text):
+        parts.setdefault(int(match.group(1)), match.group(2).strip())
+    return parts
+
+
+@dataclass(eq=False)
+class _Request:
+    text: str
+    tokens: int
+    future: asyncio.Future
+
+
+class MicroBatcher:
+    """Packs small translation requests into one numbered LLM request.
+
+    Requests arriving within ``wait`` seconds of each other, from one document
+    or from several, share a call until ``max_chunks`` or ``max_tokens`` is
+    reached. ``submit`` returns None for any request the batch could not
+    answer, so the caller falls back to a single-chunk call.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        render: Callable[[str], Prompt],
+        max_tokens: int = 2000,
+        max_chunks: int = 8,
+        wait: float = 0.05,
+        max_output_ratio: float = 4.0,
+    ):
+        self.llm = llm
+        self.render = render
+        self.max_tokens = max_tokens
+        self.max_chunks = max_chunks
+        self.wait = wait
+        self.max_output_ratio = max_output_ratio
+        self._pending: List[_Request] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        # requests and timers of an earlier run died with its loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._loop = loop
+            self._pending, self._pending_tokens, self._timer = [], 0, None
+            self._tasks = set()
+        return loop
+
+    async def submit(self, text: str, tokens: int) -> Optional[Completion]:
+        loop = self._bind()
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+
+        request = _Request(text, tokens, loop.create_future())
+        self._pending.append(request)
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_chunks:
+            self._flush()
+        elif len(self._pending) == 1:
+            self._timer = loop.call_later(self.wait, self._flush)
+        try:
+            return await request.future
+        finally:
+            # a cancelled caller must not be sent with the next batch
+            if request in self._pending:
+                self._pending.remove(request)
+                self._pending_tokens -= tokens
+                if not self._pending and self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[_Request]):
+        results: List[Optional[Completion]] = [None] * len(batch)
+        # a lone request gains nothing from the batch prompt
+        if len(batch) > 1:
+            try:
+                results = await self._translate(batch)
+            except Exception as e:
+                ic("micro batch failed, falling back to single calls", e)
+
+        for request, result in zip(batch, results):
+            if not request.future.done():
+                request.future.set_result(result)
+
+    async def _translate(self, batch: List[_Request]) -> List[Optional[Completion]]:
+        tokens = sum(request.tokens for request in batch)
+        max_output_tokens = None
+        if self.max_output_ratio:
+            max_output_tokens = max(256, int(tokens * self.max_output_ratio))
+        completion = await self.llm.acall(
+            self.render(format_parts([request.text for request in batch])),
+            max_output_tokens=max_output_tokens,
+        )
+
+        parts = parse_parts(completion.text)
+        results: List[Optional[Completion]] = []
+        for n, request in enumerate(batch, 1):
+            part = parts.get(n)
+            # missing parts and parts that lost placeholders go single
+            if part is None or placeholders_in(request.text) - placeholders_in(part):
+                results.append(None)
+                continue
+            # token usage is shared out by each request's share of the input
+            share = request.tokens / tokens if tokens else 1 / len(batch)
+            results.append(
+                Completion(
+                    text=part,
+                    key=completion.key,
+                    model=completion.model,
+                    prompt_tokens=round(completion.prompt_tokens * share),
+                    cached_tokens=round(completion.cached_tokens * share),
+                    completion_tokens=round(completion.completion_tokens * share),
+                    latency=completion.latency,
+                    time_to_first_token=completion.time_to_first_token,
+                    retries=completion.retries,
+                    batch_size=len(batch),
+                )
+            )
+        if None in results:
+            ic("micro batch parts falling back", results.count(None), len(batch))
+        return results
@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+from typing import Dict, Literal, Union
+
+import regex as re
+
+from .chunker import Chunk
+from .masking import MASK_PATTERN, PLACEHOLDER_PATTERN, placeholders_in
+
+PipelineMode = Literal["fast", "full", "adaptive"]
+
+# stage calls each chunk costs in full mode
+FULL_CALLS = 3
+
+MARKUP_PATTERN = re.compile(r"[#>*_|`~\-+=\[\]()<>]|^\s*\d+[.)]\s", re.M)
+REFERENCE_LINE = re.compile(
+    r"^\s*(?:[-*]\s*)?(?:\[\d+\]|\d+\.)\s.*\b(?:19|20)\d\d\b", re.M
+)
+
+
+@dataclass
+class PolicyStats:
+    chunks: int = 0
+    refined: int = 0
+
+    @property
+    def calls(self) -> int:
+        return self.chunks + 2 * self.refined
+
+    @property
+    def full_calls(self) -> int:
+        return FULL_CALLS * self.chunks
+
+    @property
+    def saved(self) -> int:
+        return self.full_calls - self.calls
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.saved / self.full_calls if self.full_calls else 0.0
+
+
+@dataclass
+class PipelinePolicy:
+    """Decides per chunk whether reflection and improvement run.
+
+    ``full`` always refines and ``fast`` never does. ``adaptive`` keeps the
+    basic translation of short chunks and chunks that are mostly markup,
+    numbers or references, unless the basic output looks off: lost
+    placeholders or a length far from the source.
+    """
+
+    mode: PipelineMode = "full"
+    min_tokens: int = 40
+    min_prose_ratio: float = 0.5
+    min_length_ratio: float = 0.2
+    max_length_ratio: float = 3.0
+    stats: PolicyStats = field(default_factory=PolicyStats)
+
+    def should_refine(self, chunk: Chunk, basic: str) -> bool:
+        if self.mode == "full":
+            refine = True
+        elif self.mode == "fast":
+            refine = False
+        else:
+            refine = self._needs_refinement(chunk, basic)
+
+        self.stats.chunks += 1
+        self.stats.refined += refine
+        return refine
+
+    def _needs_refinement(self, chunk: Chunk, basic: str) -> bool:
+        source = chunk.text.strip()
+        if not source:
+            return False
+
+        length_ratio = len(basic.strip()) / len(source)
+        if not self.min_length_ratio <= length_ratio <= self.max_length_ratio:
+            return True
+        if placeholders_in(source) - placeholders_in(basic):
+            return True
+
+        if chunk.tokens < self.min_tokens:
+            return False
+        return prose_ratio(source) >= self.min_prose_ratio
+
+    def summary(self) -> Dict[str, Union[str, int, float]]:
+        return dict(
+            mode=self.mode,
+            chunks=self.stats.chunks,
+            calls=self.stats.calls,
+            calls_saved=self.stats.saved,
+            saved_ratio=round(self.stats.saved_ratio, 3),
+        )
+
+
+def prose_ratio(text: str) -> float:
+    """Share of the visible characters that are words worth polishing."""
+    visible = len("".join(text.split()))
+    if not visible:
+        return 0.0
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    references = len(REFERENCE_LINE.findall(text))
+    if lines and references / len(lines) > 0.5:
+        return 0.0
+
+    text = PLACEHOLDER_PATTERN.sub("", MASK_PATTERN.sub("", text))
+    text = MARKUP_PATTERN.sub("", text)
+    letters = sum(1 for char in text if char.isalpha())
+    return letters / visible
@@ -1,9 +1,42 @@
-BASIC_TRANSLATION_PROMPT = """Your task is to provide a professional translation from {source_lang} to {target_lang} of PART of a text.
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """A stable instruction prefix and the per-call text that follows it."""
+
+    system: str
+    user: str
+
+    @property
+    def text(self) -> str:
+        return self.system + "\n\n" + self.user
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    system: str
+    user: str
+
+    def render(self, prefix: dict, **values) -> Prompt:
+        # the prefix only depends on the stage and language pair, so it is
+        # formatted once and stays byte-identical for provider prefix caching
+        return Prompt(
+            system=_format_system(self.system, tuple(sorted(prefix.items()))),
+            user=self.user.format(**values),
+        )
 
-To reiterate, you should translate only this part and ALL from this of the text, shown here between <TRANSLATE_THIS> and </TRANSLATE_THIS>:
-<TRANSLATE_THIS>
-{chunk_to_translate}
-</TRANSLATE_THIS>
+
+@lru_cache(maxsize=None)
+def _format_system(template: str, prefix: tuple) -> str:
+    return template.format(**dict(prefix))
+
+
+BASIC_TRANSLATION_PROMPT = PromptTemplate(
+    system="""Your task is to provide a professional translation from {source_lang} to {target_lang} of PART of a text.
+
+You should translate only this part and ALL from this of the text, shown in the next message between <TRANSLATE_THIS> and </TRANSLATE_THIS>.
 
 Guidelines for translate:
 1. Translate ALL content between <TRANSLATE_THIS> and </TRANSLATE_THIS> part.
@@ -11,29 +44,23 @@ Guidelines for translate:
 3. Preserve all markdown, image links, LaTeX code, and titles.
 4. Do not remove any single line from the <TRANSLATE_THIS> and </TRANSLATE_THIS> part.
 5. Even if it is a single title or a title containing incomplete paragraphs, it still needs to be translated.
+6. Keep placeholders such as @@0@@ exactly as they are and in their positions, they stand for content that must not be translated.
 
 Output only the translation of the portion you are asked to translate, and nothing else.
-"""
+""",
+    user="""<TRANSLATE_THIS>
+{chunk_to_translate}
+</TRANSLATE_THIS>
+""",
+)
 
-REFLECTION_TRANSLATION_PROMPT = """Your task is to carefully read a source text and part of a translation of that text from {source_lang} to {target_lang}, and then give constructive criticism and helpful suggestions for improving the translation.
+REFLECTION_TRANSLATION_PROMPT = PromptTemplate(
+    system="""Your task is to carefully read a source text and part of a translation of that text from {source_lang} to {target_lang}, and then give constructive criticism and helpful suggestions for improving the translation.
     The final style and tone of the translation should match the style of {target_lang} colloquially spoken in {country}.
 
-    The source text is below, delimited by XML tags <SOURCE_TEXT> and </SOURCE_TEXT>, and the part that has been translated
+    The next message holds the source text, delimited by XML tags <SOURCE_TEXT> and </SOURCE_TEXT>, and the part that has been translated
     is delimited by <TRANSLATE_THIS> and </TRANSLATE_THIS> within the source text. You can use the rest of the source text as context for critiquing the translated part. Retain all markdown image links, Latex code and multi-level title in their positions and relationships within the text.
-
-    <SOURCE_TEXT>
-    {tagged_text}
-    </SOURCE_TEXT>
-
-    To reiterate, only part of the text is being translated, shown here again between <TRANSLATE_THIS> and </TRANSLATE_THIS>:
-    <TRANSLATE_THIS>
-    {chunk_to_translate}
-    </TRANSLATE_THIS>
-
-    The translation of the indicated part, delimited below by <TRANSLATION> and </TRANSLATION>, is as follows:
-    <TRANSLATION>
-    {translation_1_chunk}
-    </TRANSLATION>
+    The part is shown again between <TRANSLATE_THIS> and </TRANSLATE_THIS>, followed by its translation delimited by <TRANSLATION> and </TRANSLATION>.
 
     When writing suggestions, pay attention to whether there are ways to improve the translation's:\n\
     (i) accuracy (by correcting errors of addition, mistranslation, omission, or untranslated text, and the content needs to be consistent.),\n\
@@ -43,33 +70,29 @@ REFLECTION_TRANSLATION_PROMPT = """Your task is to carefully read a source text
 
     Write a list of specific, helpful and constructive suggestions for improving the translation.
     Each suggestion should address one specific part of the translation.
-    Output only the suggestions and nothing else."""
-
-IMPROVE_TRANSLATION_PROMPT = """Your task is to carefully read, then improve, a translation from {source_lang} to {target_lang}, taking into
-    account a set of expert suggestions and constructive criticisms. Below, the source text, initial translation, and expert suggestions are provided.
+    Output only the suggestions and nothing else.""",
+    user="""<SOURCE_TEXT>
+{tagged_text}
+</SOURCE_TEXT>
 
-    The source text is below, delimited by XML tags <SOURCE_TEXT> and </SOURCE_TEXT>, and the part that has been translated
-    is delimited by <TRANSLATE_THIS> and </TRANSLATE_THIS> within the source text. You can use the rest of the source text
-    as context, but need to provide a translation only of the part indicated by <TRANSLATE_THIS> and </TRANSLATE_THIS>.
-
-    <SOURCE_TEXT>
-    {tagged_text}
-    </SOURCE_TEXT>
+<TRANSLATE_THIS>
+{chunk_to_translate}
+</TRANSLATE_THIS>
 
-    To reiterate, only part of the text is being translated, shown here again between <TRANSLATE_THIS> and </TRANSLATE_THIS>:
-    <TRANSLATE_THIS>
-    {chunk_to_translate}
-    </TRANSLATE_THIS>
+<TRANSLATION>
+{translation_1_chunk}
+</TRANSLATION>""",
+)
 
-    The translation of the indicated part, delimited below by <TRANSLATION> and </TRANSLATION>, is as follows:
-    <TRANSLATION>
-    {translation_1_chunk}
-    </TRANSLATION>
+IMPROVE_TRANSLATION_PROMPT = PromptTemplate(
+    system="""Your task is to carefully read, then improve, a translation from {source_lang} to {target_lang}, taking into
+    account a set of expert suggestions and constructive criticisms. The source text, initial translation, and expert suggestions are provided in the next message.
 
-    The expert translations of the indicated part, delimited below by <EXPERT_SUGGESTIONS> and </EXPERT_SUGGESTIONS>, are as follows:
-    <EXPERT_SUGGESTIONS>
-    {reflection_chunk}
-    </EXPERT_SUGGESTIONS>
+    The source text is delimited by XML tags <SOURCE_TEXT> and </SOURCE_TEXT>, and the part that has been translated
+    is delimited by <TRANSLATE_THIS> and </TRANSLATE_THIS> within the source text. You can use the rest of the source text
+    as context, but need to provide a translation only of the part indicated by <TRANSLATE_THIS> and </TRANSLATE_THIS>.
+    The part is shown again between <TRANSLATE_THIS> and </TRANSLATE_THIS>, its translation between <TRANSLATION> and </TRANSLATION>,
+    and the expert suggestions between <EXPERT_SUGGESTIONS> and </EXPERT_SUGGESTIONS>.
 
     Taking into account the expert suggestions rewrite the translation to improve it, paying attention
     to whether there are ways to improve the translation's
@@ -83,5 +106,40 @@ IMPROVE_TRANSLATION_PROMPT = """Your task is to carefully read, then improve, a
     7. even if it is a single title or a title containing incomplete paragraphs, it still needs to be translated.
     8. Preserve all markdown, image links, LaTeX code, paragraph structure, and titles.
     9. No need to include pinyin annotations.
+    10. Keep placeholders such as @@0@@ exactly as they are and in their positions.
+
+    Output only the new translation of the indicated part and nothing else.""",
+    user="""<SOURCE_TEXT>
+{tagged_text}
+</SOURCE_TEXT>
+
+<TRANSLATE_THIS>
+{chunk_to_translate}
+</TRANSLATE_THIS>
+
+<TRANSLATION>
+{translation_1_chunk}
+</TRANSLATION>
+
+<EXPERT_SUGGESTIONS>
+{reflection_chunk}
+</EXPERT_SUGGESTIONS>""",
+)
 
-    Output only the new translation of the indicated part and nothing else."""
+BATCH_TRANSLATION_PROMPT = PromptTemplate(
+    system="""Your task is to provide a professional translation from {source_lang} to {target_lang} of several independent PARTS of texts.
+
+Each part is shown in the next message between numbered tags such as <PART 1> and </PART 1>.
+
+Guidelines for translate:
+1. Translate every part on its own and ALL content of each part.
+2. Maintain paragraph structure and line breaks.
+3. Preserve all markdown, image links, LaTeX code, and titles.
+4. Do not remove any single line from any part.
+5. Even if a part is a single title or a title containing incomplete paragraphs, it still needs to be translated.
+6. Keep placeholders such as @@0@@ exactly as they are and in their positions, they stand for content that must not be translated.
+
+Output the translation of every part in the same order, each between the same numbered tags as its source, e.g. <PART 1> and </PART 1>, and nothing else.
+""",
+    user="{parts}",
+)
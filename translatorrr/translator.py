@@ -1,30 +1,54 @@
+import asyncio
+import functools
+import hashlib
 import json
 import os
-import re
 import shutil
-from dataclasses import dataclass, field
-from typing import Dict, List, Tuple
+import time
+from dataclasses import dataclass, field, replace
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
 
+import regex as re
 from icecream import ic
-from langchain_text_splitters import RecursiveCharacterTextSplitter as rcs
 from pydantic_settings import BaseSettings
 from tqdm import tqdm
 
-from .llm import LLM
+from .chunker import (
+    Chunk,
+    ChunkWindow,
+    split_markdown,
+    stream_markdown,
+    tokenized_blocks,
+)
+from .context import ContextBuilder, ContextMode
+from .incremental import ChunkPlan, ChunkState, DocumentState, plan_chunks
+from .llm import GenerationCancelled, LLM
+from .masking import MaskedText, StreamMasker, ensure_placeholders
+from .memory import TranslationMemory
+from .metrics import CallRecord, Metrics
+from .microbatch import MicroBatcher
+from .policy import PipelineMode, PipelinePolicy
 from .prompt import (
     BASIC_TRANSLATION_PROMPT,
+    BATCH_TRANSLATION_PROMPT,
     IMPROVE_TRANSLATION_PROMPT,
     REFLECTION_TRANSLATION_PROMPT,
+    Prompt,
 )
-from .utils import (
-    calculate_chunk_size,
-    num_tokens_in_string,
-    remove_hash_chars_lines,
-    replace_chinese_parentheses,
-    replace_markdown_links,
-    replace_multiple_newlines,
-    replace_spaces_in_links,
-)
+from .utils import clean_translation, replace_markdown_links
+from .writer import OutputWriter
+
+CHUNK_TOKEN_LIMIT = 1000
 
 
 class TranslatorSettings(BaseSettings):
@@ -32,6 +56,51 @@ class TranslatorSettings(BaseSettings):
     source_lang: str = "English"
     target_lang: str = "Chinese"
     country: str = "China"
+    # empty memory_path disables the shared translation memory
+    memory_path: str = "memory/translation_memory.db"
+    memory_max_mb: int = 512
+    show_progress: bool = True
+    # swap code, math, images and urls for placeholders the model copies through
+    mask_spans: bool = True
+    # stop a generation once it is this many times longer than its chunk
+    max_output_ratio: float = 4.0
+    # append one JSON line per stage call here, empty disables
+    metrics_path: str = ""
+    # Prometheus text snapshot rewritten after every translated file
+    prometheus_path: str = ""
+    # fast: basic translation only, full: basic, reflect and improve for
+    # every chunk, adaptive: reflect and improve only where heuristics say so
+    pipeline_mode: PipelineMode = "full"
+    adaptive_min_tokens: int = 40
+    adaptive_min_prose_ratio: float = 0.5
+    adaptive_min_length_ratio: float = 0.2
+    adaptive_max_length_ratio: float = 3.0
+    # pack basic translations of small chunks, also across documents, into
+    # one request
+    micro_batch: bool = False
+    micro_batch_chunk_tokens: int = 300
+    micro_batch_max_tokens: int = 2000
+    micro_batch_max_chunks: int = 8
+    micro_batch_wait: float = 0.05
+    # source context around a chunk in the reflect and improve prompts: full
+    # neighbour chunks, or a window or summary of them within context_tokens
+    context_mode: ContextMode = "window"
+    context_tokens: int = 600
+    # keep chunk hashes and translations next to the output and only
+    # re-translate what changed when the same file comes back
+    incremental: bool = False
+    # files of at least this size are read, chunked and written as a stream
+    # with flat memory, unless incremental is on; 0 streams every file
+    stream_min_mb: float = 32
+    # streamed chunks read ahead of the last one written, at least
+    # max_concurrency to keep every request slot busy
+    stream_lookahead: int = 64
+    # "Japanese:Japan, German:Germany" translates every file into each of
+    # these languages, under output_folder/<language>, from one source pass
+    target_langs: str = ""
+    # remove each source file once it is translated, as the input/ drop
+    # folder expects
+    delete_source: bool = True
     # save_as_log: bool = False
 
     class Config:
@@ -40,28 +109,168 @@ class TranslatorSettings(BaseSettings):
 
 
 class TranslationCache:
-    def __init__(self, cache_dir="cache"):
+    """Per-stage checkpoints kept as append-only JSON lines journals.
+
+    Every finished chunk appends one ``{"idx", "result"}`` record; records are
+    fsynced in batches of ``fsync_every``. Loading replays the journal, skips a
+    torn trailing record and compacts the file when it holds stale records.
+    """
+
+    def __init__(self, cache_dir="cache", fsync_every: int = 16):
         self.cache_dir = cache_dir
-        os.makedirs(cache_dir, exist_ok=True)
+        self.fsync_every = fsync_every
+        self._journals: Dict[str, TextIO] = {}
+        self._unsynced: Dict[str, int] = {}
 
     def _get_cache_path(self, name):
         return os.path.join(self.cache_dir, f"{name}.json")
 
-    def load(self, name) -> Tuple[int, List[str]]:
-        cache_file = self._get_cache_path(name)
-        if os.path.exists(cache_file):
-            with open(cache_file, encoding="utf-8") as f:
+    def _get_journal_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.jsonl")
+
+    def load_entries(self, name) -> Dict[int, str]:
+        self._close_journal(name)
+        entries: Dict[int, str] = {}
+        records = 0
+
+        # checkpoints written before the journal existed
+        legacy_file = self._get_cache_path(name)
+        if os.path.exists(legacy_file):
+            with open(legacy_file, encoding="utf-8") as f:
                 data: Dict = json.load(f)
-            return data.get("done_idx", -1), data.get("results", [])
-        return -1, []
+            entries.update(enumerate(data.get("results", [])))
+            records = -1
+
+        journal_file = self._get_journal_path(name)
+        if os.path.exists(journal_file):
+            with open(journal_file, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write from a crash, everything after is lost
+                        records = -1
+                        break
+                    entries[record["idx"]] = record["result"]
+                    records += 1
+
+        if records != len(entries):
+            self._compact(name, entries)
+        return entries
+
+    def load(self, name) -> Tuple[int, List[str]]:
+        entries = self.load_entries(name)
+        done_idx = -1
+        while done_idx + 1 in entries:
+            done_idx += 1
+        return done_idx, [entries[i] for i in range(done_idx + 1)]
+
+    def append(self, name, idx: int, result: str):
+        journal = self._journals.get(name)
+        if journal is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            journal = open(self._get_journal_path(name), "a", encoding="utf-8")
+            self._journals[name] = journal
+            self._unsynced[name] = 0
+
+        journal.write(json.dumps({"idx": idx, "result": result}, ensure_ascii=False))
+        journal.write("\n")
+        journal.flush()
+
+        self._unsynced[name] += 1
+        if self._unsynced[name] >= self.fsync_every:
+            os.fsync(journal.fileno())
+            self._unsynced[name] = 0
 
     def save(self, name, data):
-        cache_file = self._get_cache_path(name)
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        self._compact(name, dict(enumerate(data.get("results", []))))
+
+    def _compact(self, name, entries: Dict[int, str]):
+        self._close_journal(name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        journal_file = self._get_journal_path(name)
+        tmp_file = journal_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for idx in sorted(entries):
+                record = {"idx": idx, "result": entries[idx]}
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, journal_file)
+
+        legacy_file = self._get_cache_path(name)
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
+
+    def _close_journal(self, name):
+        journal = self._journals.pop(name, None)
+        self._unsynced.pop(name, None)
+        if journal is not None:
+            os.fsync(journal.fileno())
+            journal.close()
+
+    def flush(self):
+        for name in list(self._journals):
+            self._close_journal(name)
+
+    def namespace(self, name: str) -> "TranslationCache":
+        return TranslationCache(
+            os.path.join(self.cache_dir, name), fsync_every=self.fsync_every
+        )
 
     def delete(self):
-        shutil.rmtree(self.cache_dir)
+        self.flush()
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+
+class StageProgress:
+    """Results of one pipeline stage, checkpointed to the cache as chunks finish."""
+
+    def __init__(
+        self,
+        cacher: TranslationCache,
+        name: str,
+        total: Optional[int],
+        desc: str,
+        position: int = 0,
+        show_progress: bool = True,
+    ):
+        self.cacher = cacher
+        self.name = name
+        self.total = total
+        self._results = cacher.load_entries(name)
+        self._done = set(self._results)
+        self.progress = tqdm(
+            total=total,
+            initial=len(self._results),
+            desc=desc,
+            position=position,
+            disable=not show_progress,
+        )
+
+    def __contains__(self, i: int) -> bool:
+        return i in self._done
+
+    def __getitem__(self, i: int) -> str:
+        return self._results[i]
+
+    def __setitem__(self, i: int, result: str):
+        self._results[i] = result
+        self._done.add(i)
+        self.progress.update()
+        self.cacher.append(self.name, i, result)
+
+    def release(self, i: int):
+        """Forget a result that is no longer needed, it stays checkpointed."""
+        self._results.pop(i, None)
+
+    def results(self) -> List[str]:
+        return [self._results[i] for i in range(self.total)]
+
+    def close(self):
+        self.progress.close()
 
 
 @dataclass
@@ -69,205 +278,727 @@ class Translator:
     settings: TranslatorSettings = field(default_factory=TranslatorSettings)
     llm: LLM = field(default_factory=LLM)
     cacher: TranslationCache = field(default_factory=TranslationCache)
+    memory: Optional[TranslationMemory] = None
+    # receives (stage, chunk index, text) as streamed output arrives, a text
+    # of None drops what that stage streamed so far, as a new attempt begins
+    on_delta: Optional[Callable[[str, int, Optional[str]], None]] = None
+    metrics: Optional[Metrics] = None
+    policy: Optional[PipelinePolicy] = None
+    batcher: Optional[MicroBatcher] = None
+    # output path -> source written to it, so two documents never share one
+    outputs: Dict[str, str] = field(default_factory=dict, repr=False)
 
     def __post_init__(self):
-        os.makedirs(self.settings.output_folder, exist_ok=True)
+        if self.memory is None and self.settings.memory_path:
+            self.memory = TranslationMemory(
+                self.settings.memory_path,
+                max_bytes=self.settings.memory_max_mb * 1024 * 1024,
+            )
+        if self.metrics is None:
+            self.metrics = Metrics(self.settings.metrics_path)
+        if self.policy is None:
+            self.policy = PipelinePolicy(
+                mode=self.settings.pipeline_mode,
+                min_tokens=self.settings.adaptive_min_tokens,
+                min_prose_ratio=self.settings.adaptive_min_prose_ratio,
+                min_length_ratio=self.settings.adaptive_min_length_ratio,
+                max_length_ratio=self.settings.adaptive_max_length_ratio,
+            )
+        if self.batcher is None and self.settings.micro_batch:
+            self.batcher = MicroBatcher(
+                self.llm,
+                lambda parts: BATCH_TRANSLATION_PROMPT.render(
+                    self._prompt_prefix, parts=parts
+                ),
+                max_tokens=self.settings.micro_batch_max_tokens,
+                max_chunks=self.settings.micro_batch_max_chunks,
+                wait=self.settings.micro_batch_wait,
+                max_output_ratio=self.settings.max_output_ratio,
+            )
 
     def translate_file(self, path: str) -> str:
+        return self.llm.run(self.atranslate_file(path))
+
+    async def atranslate_file(self, path: str) -> str:
+        if self._streams(path):
+            return await self._atranslate_stream(path)
+
         # Read source text
         with open(path, encoding="utf-8") as file:
             source_text = file.read()
 
-        # Call translation logic
-        translation = self.translate(source_text)
-
-        # Check if first line is a level-1 heading
-        first_line = translation.split('\n')[0]
-        filename = os.path.splitext(os.path.basename(path))[0]
-        if first_line.strip().startswith('# '):
-            heading = first_line[2:].strip()
-            if heading:  # ensure heading is not empty
-                filename = re.sub(r'[<>:"/\\|?*]', '', heading)
-
-        # Set translation output path
-        translation_output_path = os.path.join(
-            self.settings.output_folder,
-            f"{filename}.md",
+        # Each document checkpoints into its own cache namespace
+        cacher = self.cacher.namespace(self._document_id(path, source_text))
+        state_path = os.path.join(
+            self.settings.output_folder, f".{self._path_id(path)}.state.json"
+        )
+        plan = None
+        if self.settings.incremental:
+            previous = DocumentState.load(state_path)
+            plan, masks = self._prepare_incremental(source_text, previous)
+            chunks = plan.chunks
+        else:
+            chunks, masks = self._prepare(source_text)
+        del source_text  # only the chunks are needed from here on
+
+        translation_output_path, translations = await self._translate_chunks(
+            chunks, masks, path, cacher, plan
         )
 
-        # Write translation result
-        with open(translation_output_path, "w", encoding="utf-8") as output_file:
-            output_file.write(translation)
-
-        # Remove source text
-        os.remove(path)
-        self.cacher.delete()
+        if plan is not None:
+            # a changed first heading renames the output, drop the stale one
+            if (
+                previous
+                and previous.output_path != translation_output_path
+                and os.path.exists(previous.output_path)
+            ):
+                os.remove(previous.output_path)
+            DocumentState(
+                output_path=translation_output_path,
+                chunks=[
+                    ChunkState(blocks=hashes, translation=translations[i])
+                    for i, hashes in enumerate(plan.block_hashes)
+                ],
+            ).save(state_path)
+
+        self._finish_document(path, cacher)
         return translation_output_path.strip()
 
-    def translate(self, source_text: str) -> str:
-        source_text = replace_markdown_links(source_text)
-        num_tokens_in_text = num_tokens_in_string(source_text)
-
-        ic(num_tokens_in_text)
-
-        # if self.settings.save_log:
-        #     save_cache(f"saved_cache/{textname}/{MODEL}/", source_text, "source_text")
-        token_size = calculate_chunk_size(
-            token_count=num_tokens_in_text, token_limit=1000
+    @property
+    def targets(self) -> List[Tuple[str, str]]:
+        """``(target_lang, country)`` pairs parsed from ``target_langs``."""
+        targets = []
+        for entry in self.settings.target_langs.split(","):
+            if not entry.strip():
+                continue
+            lang, _, country = entry.partition(":")
+            if not country.strip():
+                raise ValueError(f"target language without a country: {entry!r}")
+            targets.append((lang.strip(), country.strip()))
+        return targets
+
+    def for_language(self, target_lang: str, country: str) -> "Translator":
+        """A translator into another language, writing to its own subfolder.
+
+        It shares the LLM, cache, memory, metrics and pipeline policy.
+        """
+        settings = self.settings.model_copy(
+            update=dict(
+                target_lang=target_lang,
+                country=country,
+                output_folder=os.path.join(
+                    self.settings.output_folder,
+                    re.sub(r'[<>:"/\\|?*]', "", target_lang),
+                ),
+                target_langs="",
+            )
         )
-        ic(token_size)
+        # the micro-batcher renders prompts for one language
+        return replace(self, settings=settings, batcher=None)
+
+    def translate_file_to(
+        self, path: str, targets: Optional[List[Tuple[str, str]]] = None
+    ) -> Dict[str, str]:
+        return self.llm.run(self.atranslate_file_to(path, targets))
+
+    async def atranslate_file_to(
+        self, path: str, targets: Optional[List[Tuple[str, str]]] = None
+    ) -> Dict[str, str]:
+        """Translate a file into several languages from one source pass.
+
+        The file is read, masked and chunked once, then every
+        ``(target_lang, country)`` of ``targets`` (default: ``target_langs``)
+        runs the stages concurrently over the same chunks, checkpointing into
+        its own namespace of the document's cache. Returns the output path of
+        every language. Files are never streamed or translated incrementally
+        here.
+        """
+        targets = targets or self.targets
+        with open(path, encoding="utf-8") as file:
+            source_text = file.read()
 
-        text_splitter = rcs.from_tiktoken_encoder(
-            model_name="gpt-4o",
-            chunk_size=token_size,
-            chunk_overlap=0,
+        cacher = self.cacher.namespace(self._document_id(path, source_text))
+        chunks, masks = self._prepare(source_text)
+        del source_text
+
+        translators = {
+            lang: self.for_language(lang, country) for lang, country in targets
+        }
+        results = await asyncio.gather(
+            *(
+                translator._translate_chunks(
+                    chunks,
+                    masks,
+                    path,
+                    cacher.namespace(
+                        os.path.basename(translator.settings.output_folder)
+                    ),
+                )
+                for translator in translators.values()
+            ),
+            return_exceptions=True,
         )
+        # finished languages keep their checkpoints, a retry only redoes the rest
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        self._finish_document(path, cacher)
+        return {
+            lang: output_path.strip()
+            for lang, (output_path, _) in zip(translators, results)
+        }
+
+    async def _translate_chunks(
+        self,
+        chunks: List[Chunk],
+        masks: Optional[List[MaskedText]],
+        path: str,
+        cacher: TranslationCache,
+        plan: Optional[ChunkPlan] = None,
+    ) -> Tuple[str, Dict[int, str]]:
+        """Translate the prepared chunks of ``path`` into the output folder.
+
+        Returns the output path and, for an incremental ``plan``, the restored
+        translation of every chunk.
+        """
+        # Finished chunks are restored, cleaned and written out in order
+        writer = self._writer(path)
+        translations: Dict[int, str] = {}
+
+        def on_chunk(i: int, text: str):
+            if masks:
+                text = masks[i].restore(text)
+            if plan is not None:
+                translations[i] = text
+            writer.add(i, text)
+
+        try:
+            await self._chunk_translation(
+                chunks,
+                cacher,
+                on_chunk=on_chunk,
+                reused=plan.reused if plan else None,
+            )
+        except BaseException:
+            writer.close()
+            raise
+        return writer.finish(), translations
+
+    def _streams(self, path: str) -> bool:
+        if self.settings.incremental:
+            return False
+        return os.path.getsize(path) >= self.settings.stream_min_mb * 1024 * 1024
+
+    async def _atranslate_stream(self, path: str) -> str:
+        cacher = self.cacher.namespace(self._file_id(path))
+        writer = self._writer(path)
+        # every chunk is masked on its own, its spans go once it is written
+        masks: Dict[int, MaskedText] = {}
+
+        def on_chunk(i: int, text: str):
+            masked = masks.pop(i, None)
+            writer.add(i, masked.restore(text) if masked else text)
+
+        try:
+            with open(path, encoding="utf-8") as file:
+                num_chunks = await self._stream_translation(
+                    self._stream_chunks(file, masks), cacher, on_chunk
+                )
+        except BaseException:
+            writer.close()
+            raise
+        ic(num_chunks)
+        translation_output_path = writer.finish()
 
-        chunks = text_splitter.split_text(source_text)
-        final_chunks = self._chunk_translation(chunks)
-
-        cleaned_text = remove_hash_chars_lines("".join(final_chunks))
-        cleaned_text = replace_chinese_parentheses(cleaned_text)
-        cleaned_text = replace_spaces_in_links(cleaned_text)
-        final_translation = replace_multiple_newlines(cleaned_text)
-
-        return final_translation
+        self._finish_document(path, cacher)
+        return translation_output_path.strip()
 
-    def _chunk_translation(self, chunks):
-        basic_trans = self._basic_translate(chunks)
+    def _finish_document(self, path: str, cacher: TranslationCache):
+        if self.settings.prometheus_path:
+            self.metrics.write_prometheus(self.settings.prometheus_path)
 
-        reflect_guide = self._reflect_translate(
-            chunks,
-            basic_trans,
+        # Remove source text
+        if self.settings.delete_source:
+            os.remove(path)
+        cacher.delete()
+
+    def _writer(self, path: str) -> OutputWriter:
+        source = os.path.abspath(path)
+
+        def claim(output_path: str) -> str:
+            # same-named documents of one batch get numbered outputs
+            base, ext = os.path.splitext(output_path)
+            n = 1
+            while self.outputs.setdefault(output_path, source) != source:
+                n += 1
+                output_path = f"{base} ({n}){ext}"
+            if n > 1:
+                ic(f"{base}{ext} belongs to another document, writing {output_path}")
+            return output_path
+
+        return OutputWriter(
+            self.settings.output_folder,
+            os.path.splitext(os.path.basename(path))[0],
+            part_id=self._path_id(path),
+            claim=claim,
         )
 
-        final_trans = self._improve_translation(
-            chunks,
-            basic_trans,
-            reflect_guide,
-        )
+    @staticmethod
+    def _path_id(path: str) -> str:
+        # temporary files of same-named documents from other folders differ
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8"))
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return f"{stem}-{digest.hexdigest()[:12]}"
+
+    @staticmethod
+    def _document_id(path: str, source_text: str) -> str:
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8"))
+        digest.update(source_text.encode("utf-8"))
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return f"{stem}-{digest.hexdigest()[:12]}"
+
+    @staticmethod
+    def _file_id(path: str) -> str:
+        # streamed documents chunk differently, so they get their own namespace
+        digest = hashlib.sha256(os.path.abspath(path).encode("utf-8"))
+        digest.update(b"stream")
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return f"{stem}-{digest.hexdigest()[:12]}"
 
-        return final_trans
+    def translate(self, source_text: str) -> str:
+        return self.llm.run(self.atranslate(source_text))
 
-    def _basic_translate(self, chunks: List[str]) -> List[str]:
-        done_idx, result_chunks = self.cacher.load("init_translation")
+    async def atranslate(
+        self, source_text: str, cacher: Optional[TranslationCache] = None
+    ) -> str:
+        chunks, masks = self._prepare(source_text)
+        final_chunks = await self._chunk_translation(chunks, cacher or self.cacher)
 
-        if done_idx == len(chunks) - 1:
-            return result_chunks
+        if masks:
+            final_chunks = [
+                masked.restore(text) for masked, text in zip(masks, final_chunks)
+            ]
+        translation = "".join(final_chunks)
 
-        for i in tqdm(range(done_idx + 1, len(chunks)), desc="1: basic translating"):
-            prompt = BASIC_TRANSLATION_PROMPT.format(
-                source_lang=self.settings.source_lang,
-                target_lang=self.settings.target_lang,
-                chunk_to_translate=chunks[i],
-            )
+        return clean_translation(translation)
 
-            translation = self.llm.do(prompt)
-            result_chunks.append(translation)
-
-            self.cacher.save(
-                "init_translation",
-                {
-                    "done_idx": i,
-                    "results": result_chunks,
-                },
-            )
+    def _mask(self, source_text: str) -> Tuple[str, Optional[StreamMasker]]:
+        source_text = replace_markdown_links(source_text)
+        if not self.settings.mask_spans:
+            return source_text, None
+        masker = StreamMasker()
+        return masker.mask(source_text), masker
+
+    @staticmethod
+    def _take(
+        chunks: List[Chunk], masker: Optional[StreamMasker]
+    ) -> Tuple[List[Chunk], Optional[List[MaskedText]]]:
+        # placeholders are numbered from zero within every chunk
+        if masker is None:
+            return chunks, None
+        masks = [masker.take(chunk.text) for chunk in chunks]
+        chunks = [
+            Chunk(masked.text, chunk.start, chunk.end, chunk.tokens)
+            for masked, chunk in zip(masks, chunks)
+        ]
+        return chunks, masks
+
+    def _prepare(
+        self, source_text: str
+    ) -> Tuple[List[Chunk], Optional[List[MaskedText]]]:
+        source_text, masker = self._mask(source_text)
 
-        return result_chunks
+        # if self.settings.save_log:
+        #     save_cache(f"saved_cache/{textname}/{MODEL}/", source_text, "source_text")
+        chunks = split_markdown(source_text, token_limit=CHUNK_TOKEN_LIMIT)
+        num_tokens_in_text = sum(chunk.tokens for chunk in chunks)
+        ic(num_tokens_in_text)
+        ic(len(chunks))
+
+        return self._take(chunks, masker)
+
+    def _prepare_incremental(
+        self, source_text: str, previous: Optional[DocumentState]
+    ) -> Tuple[ChunkPlan, Optional[List[MaskedText]]]:
+        source_text, masker = self._mask(source_text)
+        plan = plan_chunks(
+            tokenized_blocks(source_text),
+            CHUNK_TOKEN_LIMIT,
+            previous,
+            restore=masker.restore if masker else lambda text: text,
+        )
+        ic(len(plan.chunks))
+        ic(len(plan.reused))
+
+        plan.chunks, masks = self._take(plan.chunks, masker)
+        return plan, masks
+
+    def _stream_chunks(
+        self, file: TextIO, masks: Dict[int, MaskedText]
+    ) -> Iterator[Chunk]:
+        masker = StreamMasker() if self.settings.mask_spans else None
+
+        def lines():
+            offset = 0
+            for line in file:
+                # the link pattern never crosses a line break
+                line = replace_markdown_links(line)
+                yield offset, line
+                offset += len(line)
+
+        chunks = stream_markdown(
+            lines(), CHUNK_TOKEN_LIMIT, transform=masker.mask if masker else None
+        )
+        for i, chunk in enumerate(chunks):
+            if masker:
+                masks[i] = masker.take(chunk.text)
+                chunk = Chunk(masks[i].text, chunk.start, chunk.end, chunk.tokens)
+            yield chunk
 
-    def _reflect_translate(
+    async def _chunk_translation(
         self,
-        source_chunks: List[str],
-        basic_trans: List[str],
+        chunks: List[Chunk],
+        cacher: TranslationCache,
+        on_chunk: Optional[Callable[[int, str], None]] = None,
+        reused: Optional[Dict[int, str]] = None,
     ) -> List[str]:
-        done_idx, result_chunks = self.cacher.load("reflection_chunks")
-
-        if done_idx == len(source_chunks) - 1:
-            return result_chunks
+        """Run every chunk through the stages the pipeline policy asks for.
+
+        With ``on_chunk`` each final chunk is handed over as soon as it is done
+        and dropped from memory, and an empty list is returned. Chunks found in
+        ``reused`` skip the stages and keep the given translation.
+        """
+        stages = self._stages(cacher, len(chunks))
+        context = self._context(chunks)
+        # Admit chunks in order and let each one run through all three stages,
+        # so early chunks finish first instead of waiting on stage barriers.
+        window = asyncio.Semaphore(self.llm.settings.max_concurrency)
+
+        async def translate_chunk(i: int):
+            async with window:
+                await self._translate_chunk(
+                    chunks, i, stages, context, on_chunk=on_chunk, reused=reused
+                )
 
-        for i in tqdm(
-            range(done_idx + 1, len(source_chunks)),
-            desc="2: reflect guiding",
-        ):
-            tagged_text = (
-                ("".join(source_chunks[max(i - 2, 0) : i]) if i > 0 else "")
-                + "<TRANSLATE_THIS>"
-                + source_chunks[i]
-                + "</TRANSLATE_THIS>"
-                + (
-                    "".join(source_chunks[i + 1 : min(i + 2, len(source_chunks))])
-                    if i < len(source_chunks) - 1
-                    else ""
+        tasks = [asyncio.ensure_future(translate_chunk(i)) for i in range(len(chunks))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # gather leaves the other chunks running when one fails
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for stage in stages:
+                stage.close()
+            cacher.flush()
+
+        return stages[-1].results() if on_chunk is None else []
+
+    async def _stream_translation(
+        self,
+        chunks: Iterable[Chunk],
+        cacher: TranslationCache,
+        on_chunk: Callable[[int, str], None],
+    ) -> int:
+        """``_chunk_translation`` over chunks that are produced lazily.
+
+        Chunks are pulled only while fewer than ``stream_lookahead`` of them
+        wait to be handed over in order, and are forgotten once no other
+        chunk's context needs them, so memory stays flat whatever the length
+        of the document. Returns the number of chunks.
+        """
+        window = ChunkWindow()
+        stages = self._stages(cacher, None)
+        context = self._context(window)
+        slots = asyncio.Semaphore(self.llm.settings.max_concurrency)
+        progress = asyncio.Condition()
+        tasks: Set[asyncio.Task] = set()
+        finished: Set[int] = set()
+        errors: List[Exception] = []
+        written = 0
+
+        async def translate_chunk(i: int):
+            nonlocal written
+            try:
+                async with slots:
+                    await self._translate_chunk(
+                        window, i, stages, context, on_chunk=on_chunk
+                    )
+            except Exception as e:
+                errors.append(e)
+            else:
+                finished.add(i)
+                while written in finished:
+                    finished.remove(written)
+                    # the chunk `before` back is nobody's context any more
+                    window.release(written - context.before)
+                    written += 1
+            async with progress:
+                progress.notify_all()
+
+        async def admit(i: int):
+            async with progress:
+                await progress.wait_for(
+                    lambda: errors or i - written < self.settings.stream_lookahead
                 )
+            if errors:
+                raise errors[0]
+            task = asyncio.create_task(translate_chunk(i))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        try:
+            # a chunk starts once the chunks after it in its context are read
+            for chunk in chunks:
+                context.add(chunk)
+                if len(window) > context.after:
+                    await admit(len(window) - 1 - context.after)
+            for i in range(max(len(window) - context.after, 0), len(window)):
+                await admit(i)
+            await asyncio.gather(*tasks)
+            if errors:
+                raise errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for stage in stages:
+                stage.close()
+            cacher.flush()
+
+        return len(window)
+
+    def _stages(
+        self, cacher: TranslationCache, total: Optional[int]
+    ) -> List[StageProgress]:
+        return [
+            StageProgress(
+                cacher,
+                name,
+                total,
+                desc,
+                position=position,
+                show_progress=self.settings.show_progress,
             )
-            prompt = REFLECTION_TRANSLATION_PROMPT.format(
-                source_lang=self.settings.source_lang,
-                target_lang=self.settings.target_lang,
-                country=self.settings.country,
-                tagged_text=tagged_text,
-                chunk_to_translate=source_chunks[i],
-                translation_1_chunk=basic_trans[i],
+            for position, (name, desc) in enumerate(
+                [
+                    ("init_translation", "1: basic translating"),
+                    ("reflection_chunks", "2: reflect guiding"),
+                    ("improve_chunks", "3: improve translating"),
+                ]
             )
+        ]
 
-            reflection = self.llm.do(prompt)
-            result_chunks.append(reflection)
+    def _context(self, chunks: List[Chunk]) -> ContextBuilder:
+        return ContextBuilder(
+            chunks,
+            mode=self.settings.context_mode,
+            budget=self.settings.context_tokens,
+        )
 
-            self.cacher.save(
-                "reflection_chunks",
-                {
-                    "done_idx": i,
-                    "results": result_chunks,
-                },
+    async def _translate_chunk(
+        self,
+        chunks: List[Chunk],
+        i: int,
+        stages: List[StageProgress],
+        context: ContextBuilder,
+        on_chunk: Optional[Callable[[int, str], None]] = None,
+        reused: Optional[Dict[int, str]] = None,
+    ):
+        basic_trans, reflect_guide, final_trans = stages
+        if reused and i in reused and i not in final_trans:
+            final_trans[i] = reused[i]
+        if i not in basic_trans and i not in final_trans:
+            basic_trans[i] = await self._basic_translate(chunks, i)
+        if i not in final_trans and (
+            i in reflect_guide or self.policy.should_refine(chunks[i], basic_trans[i])
+        ):
+            tagged_text = context.tagged_text(i)
+            if i not in reflect_guide:
+                reflect_guide[i] = await self._reflect_translate(
+                    chunks, i, basic_trans[i], tagged_text
+                )
+            final_trans[i] = await self._improve_translation(
+                chunks, i, basic_trans[i], reflect_guide[i], tagged_text
             )
+        elif i not in final_trans:
+            reflect_guide[i] = ""
+            final_trans[i] = self._keep_basic(chunks, i, basic_trans[i])
+        if on_chunk is not None:
+            on_chunk(i, final_trans[i])
+            for stage in stages:
+                stage.release(i)
+        context.release(i)
+
+    @property
+    def _prompt_prefix(self) -> Dict[str, str]:
+        return dict(
+            source_lang=self.settings.source_lang,
+            target_lang=self.settings.target_lang,
+            country=self.settings.country,
+        )
+
+    async def _basic_translate(self, chunks: List[Chunk], i: int) -> str:
+        prompt = BASIC_TRANSLATION_PROMPT.render(
+            self._prompt_prefix,
+            chunk_to_translate=chunks[i].text,
+        )
 
-        return result_chunks
+        batch = (
+            self.batcher is not None
+            and chunks[i].tokens <= self.settings.micro_batch_chunk_tokens
+        )
+        return await self._ask(
+            "basic",
+            chunks[i],
+            i,
+            prompt,
+            self._max_output_tokens(chunks[i]),
+            batch=batch,
+        )
 
-    def _improve_translation(
+    async def _reflect_translate(
         self,
-        source_chunks: List[str],
-        basic_trans: List[str],
-        reflect_guide: List[str],
-    ) -> List[str]:
-        done_idx, result_chunks = self.cacher.load("improve_chunks")
+        source_chunks: List[Chunk],
+        i: int,
+        basic_trans: str,
+        tagged_text: str,
+    ) -> str:
+        prompt = REFLECTION_TRANSLATION_PROMPT.render(
+            self._prompt_prefix,
+            tagged_text=tagged_text,
+            chunk_to_translate=source_chunks[i].text,
+            translation_1_chunk=basic_trans,
+        )
 
-        if done_idx == len(source_chunks) - 1:
-            return result_chunks
+        # without suggestions the improve step simply polishes the translation
+        return await self._ask(
+            "reflect",
+            source_chunks[i],
+            i,
+            prompt,
+            self._max_output_tokens(source_chunks[i]),
+            fallback="",
+        )
 
-        for i in tqdm(
-            range(done_idx + 1, len(source_chunks)),
-            desc="3: improve translating",
-        ):
-            tagged_text = (
-                ("".join(source_chunks[max(i - 2, 0) : i]) if i > 0 else "")
-                + "<TRANSLATE_THIS>"
-                + source_chunks[i]
-                + "</TRANSLATE_THIS>"
-                + (
-                    "".join(source_chunks[i + 1 : min(i + 2, len(source_chunks))])
-                    if i < len(source_chunks) - 1
-                    else ""
-                )
-            )
+    async def _improve_translation(
+        self,
+        source_chunks: List[Chunk],
+        i: int,
+        basic_trans: str,
+        reflect_guide: str,
+        tagged_text: str,
+    ) -> str:
+        prompt = IMPROVE_TRANSLATION_PROMPT.render(
+            self._prompt_prefix,
+            tagged_text=tagged_text,
+            chunk_to_translate=source_chunks[i].text,
+            translation_1_chunk=basic_trans,
+            reflection_chunk=reflect_guide,
+        )
 
-            prompt = IMPROVE_TRANSLATION_PROMPT.format(
-                source_lang=self.settings.source_lang,
-                target_lang=self.settings.target_lang,
-                tagged_text=tagged_text,
-                chunk_to_translate=source_chunks[i],
-                translation_1_chunk=basic_trans[i],
-                reflection_chunk=reflect_guide[i],
+        translation_2 = await self._ask(
+            "improve",
+            source_chunks[i],
+            i,
+            prompt,
+            self._max_output_tokens(source_chunks[i]),
+            fallback=basic_trans,
+        )
+        if self.settings.mask_spans:
+            translation_2 = ensure_placeholders(
+                source_chunks[i].text, translation_2, fallback=basic_trans
             )
 
-            translation_2 = self.llm.do(prompt)
+        return "\n\n" + translation_2
+
+    def _keep_basic(self, source_chunks: List[Chunk], i: int, basic_trans: str) -> str:
+        if self.settings.mask_spans:
+            basic_trans = ensure_placeholders(source_chunks[i].text, basic_trans)
+        return "\n\n" + basic_trans
 
-            result_chunks.append("\n\n" + translation_2)
+    def _max_output_tokens(self, chunk: Chunk) -> Optional[int]:
+        if not self.settings.max_output_ratio:
+            return None
+        return max(256, int(chunk.tokens * self.settings.max_output_ratio))
 
-            self.cacher.save(
-                "improve_chunks",
-                {
-                    "done_idx": i,
-                    "results": result_chunks,
-                },
+    async def _ask(
+        self,
+        stage: str,
+        chunk: Chunk,
+        i: int,
+        prompt: Prompt,
+        max_output_tokens: Optional[int] = None,
+        fallback: Optional[str] = None,
+        batch: bool = False,
+    ) -> str:
+        record = CallRecord(stage=stage, chunk_index=i, model=self.llm.model)
+        start = time.perf_counter()
+
+        def memory_key(model: str) -> str:
+            # the rendered prompt carries the context and earlier-stage outputs
+            return self.memory.make_key(
+                stage,
+                chunk.text,
+                self.settings.source_lang,
+                self.settings.target_lang,
+                model,
+                context=prompt.text,
             )
 
-        return result_chunks
+        if self.memory is not None:
+            key = memory_key(record.model)
+            cached = self.memory.get(key)
+            if cached is not None:
+                record.cache_hit = True
+                record.latency = time.perf_counter() - start
+                self.metrics.record(record)
+                return cached
+
+        on_delta = None
+        if self.on_delta is not None:
+            on_delta = functools.partial(self.on_delta, stage, i)
+
+        try:
+            completion = None
+            if batch:
+                completion = await self.batcher.submit(chunk.text, chunk.tokens)
+                if completion is not None and on_delta is not None:
+                    on_delta(completion.text)
+            if completion is None:
+                # without a fallback a runaway generation would fail the document
+                completion = await self.llm.acall(
+                    prompt,
+                    on_delta=on_delta,
+                    max_output_tokens=max_output_tokens,
+                    retry_cancelled=fallback is None,
+                )
+        except Exception as e:
+            record.error = repr(e)
+            record.latency = time.perf_counter() - start
+            self.metrics.record(record)
+            if fallback is None or not isinstance(e, GenerationCancelled):
+                raise
+            ic(stage, i, e)
+            return fallback
+
+        record.key = completion.key
+        record.model = completion.model
+        record.prompt_tokens = completion.prompt_tokens
+        record.cached_tokens = completion.cached_tokens
+        record.completion_tokens = completion.completion_tokens
+        record.time_to_first_token = completion.time_to_first_token
+        record.retries = completion.retries
+        record.hedged = completion.hedged
+        record.batch_size = completion.batch_size
+        record.latency = time.perf_counter() - start
+        self.metrics.record(record)
+
+        if self.memory is not None:
+            # a failover model may have answered, file it under that model
+            self.memory.put(memory_key(completion.model), stage, completion.text)
+        return completion.text
@@ -1,5 +1,6 @@
 import json
 import os
+from functools import lru_cache
 
 import regex as re
 import tiktoken
@@ -12,8 +13,13 @@ def replace_markdown_links(text):
     return replaced_text
 
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "o200k_base") -> tiktoken.Encoding:
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens_in_string(input_str: str, encoding_name: str = "o200k_base") -> int:
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(input_str))
     return num_tokens
 
@@ -52,20 +58,141 @@ def remove_hash_chars_lines(text):
     return cleaned_text
 
 
+# One pass of remove_hash_chars_lines, replace_chinese_parentheses,
+# replace_spaces_in_links and replace_multiple_newlines: a "gap" is a run of
+# blank and hash-only lines between two lines with content.
+CLEANUP_PATTERN = re.compile(
+    r"(?P<link>\[(?P<label>[^\]]+)\](?:（(?P<cn_url>[^）]+)）|\((?P<url>[^)]+)\)))"
+    r"|(?P<gap>(?:^[^\S\n]*#*[^\S\n]*\n)+(?:[^\S\n]*#*[^\S\n]*\Z)?"
+    r"|^[^\S\n]*#+[^\S\n]*\Z)",
+    flags=re.MULTILINE,
+)
+BLANK_OR_HASH_LINE = re.compile(r"[^\S\n]*#*[^\S\n]*")
+HASH_LINES = re.compile(r"^\s*#+\s*$", flags=re.MULTILINE)
+MULTIPLE_NEWLINES = re.compile(r"\n{3,}")
+
+
+def _cleanup_replacer(match):
+    if match.group("link"):
+        url = match.group("cn_url") or match.group("url")
+        return f"[{match.group('label')}]({url.replace(' ', '%20')})"
+
+    gap = match.group("gap")
+    if "#" in gap:
+        # remove_hash_chars_lines on the gap alone; the stand-in for the next
+        # line keeps $ from matching after the gap's last newline
+        if match.end() == len(match.string):
+            gap = HASH_LINES.sub("", gap)
+        else:
+            gap = HASH_LINES.sub("", gap + "x")[:-1]
+    # the newline ending the previous line belongs to the same run
+    prefix = "\n" if match.start() else ""
+    return MULTIPLE_NEWLINES.sub("\n\n", prefix + gap)[len(prefix) :]
+
+
+def clean_translation(text: str, pos: int = 0) -> str:
+    return CLEANUP_PATTERN.sub(_cleanup_replacer, text, pos=pos)
+
+
+class TranslationCleaner:
+    """``clean_translation`` over text that arrives piece by piece.
+
+    Everything after the second-to-last line with content is held back, so
+    newline runs and hash-only lines are never split between two passes. The
+    held back text starts with the newline ending the emitted part, which is
+    skipped when matching so it is not mistaken for the start of the text.
+    """
+
+    def __init__(self):
+        self._tail = ""
+        self._pos = 0
+
+    def feed(self, text: str) -> str:
+        buffer = self._tail + text
+        cut = self._safe_cut(buffer)
+        if not cut:
+            self._tail = buffer
+            return ""
+
+        self._tail = buffer[cut:]
+        cleaned = clean_translation(buffer[:cut], self._pos)
+        self._pos = 1
+        return cleaned
+
+    def finish(self) -> str:
+        tail, self._tail = self._tail, ""
+        return clean_translation(tail, min(self._pos, len(tail)))
+
+    @staticmethod
+    def _safe_cut(buffer: str) -> int:
+        end = len(buffer)
+        seen_content = False
+        while end > 0:
+            start = buffer.rfind("\n", 0, end) + 1
+            if not BLANK_OR_HASH_LINE.fullmatch(buffer, start, end):
+                if seen_content:
+                    return end
+                seen_content = True
+            end = start - 1
+        return 0
+
+
+TRANSLATION_TAGS = [
+    "<TRANSLATION>",
+    "</TRANSLATION>",
+    "</TRANSLATE_THIS>",
+    "<TRANSLATE_THIS>",
+    "<TRANSLATE_this>",
+    "</TRANSLATE_this>",
+]
+
+
 def remove_translation_tags(text: str) -> str:
-    replacements = [
-        ("<TRANSLATION>", ""),
-        ("</TRANSLATION>", ""),
-        ("</TRANSLATE_THIS>", ""),
-        ("<TRANSLATE_THIS>", ""),
-        ("<TRANSLATE_this>", ""),
-        ("</TRANSLATE_this>", ""),
-    ]
-    for old, new in replacements:
-        text = text.replace(old, new)
+    for tag in TRANSLATION_TAGS:
+        text = text.replace(tag, "")
     return text.strip()
 
 
+class TranslationTagStripper:
+    """Incremental ``remove_translation_tags`` for streamed text.
+
+    A trailing fragment that could still grow into a tag and trailing
+    whitespace are held back until the next delta decides them.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._whitespace = ""
+        self._started = False
+
+    def feed(self, delta: str) -> str:
+        text = self._pending + delta
+        for tag in TRANSLATION_TAGS:
+            text = text.replace(tag, "")
+
+        self._pending = ""
+        idx = text.rfind("<")
+        if idx != -1 and any(tag.startswith(text[idx:]) for tag in TRANSLATION_TAGS):
+            text, self._pending = text[:idx], text[idx:]
+        return self._emit(text)
+
+    def finish(self) -> str:
+        text, self._pending = self._pending, ""
+        return self._emit(text)
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+
+        text = self._whitespace + text
+        stripped = text.rstrip()
+        self._whitespace = text[len(stripped) :]
+        return stripped
+
+
 def calculate_chunk_size(token_count: int, token_limit: int) -> int:
     """
     Calculate the chunk size based on the token count and token limit.
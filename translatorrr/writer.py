@@ -0,0 +1,77 @@
+import os
+import re
+from typing import Callable, Dict, Optional
+
+from .utils import TranslationCleaner
+
+
+class OutputWriter:
+    """Writes translated chunks to disk in order as soon as they are ready.
+
+    Chunks may arrive out of order; each contiguous run is cleaned and
+    appended to a hidden ``.part`` file that is renamed into place by
+    ``finish``. ``part_id`` names that file, and must differ between documents
+    written at the same time. ``claim`` may move the final path elsewhere.
+    """
+
+    def __init__(
+        self,
+        output_folder: str,
+        filename: str,
+        part_id: Optional[str] = None,
+        claim: Optional[Callable[[str], str]] = None,
+    ):
+        self.output_folder = output_folder
+        self.filename = filename
+        self.claim = claim
+        self.part_path = os.path.join(output_folder, f".{part_id or filename}.md.part")
+        os.makedirs(output_folder, exist_ok=True)
+        self.first_line: Optional[str] = None
+
+        self._file = open(self.part_path, "w", encoding="utf-8")
+        self._cleaner = TranslationCleaner()
+        self._pending: Dict[int, str] = {}
+        self._next_idx = 0
+        self._head = ""
+
+    def add(self, idx: int, text: str):
+        self._pending[idx] = text
+        while self._next_idx in self._pending:
+            self._write(self._cleaner.feed(self._pending.pop(self._next_idx)))
+            self._next_idx += 1
+
+    def _write(self, text: str):
+        if not text:
+            return
+        if self.first_line is None:
+            self._head += text
+            if "\n" in self._head:
+                self.first_line = self._head.split("\n")[0]
+        self._file.write(text)
+        self._file.flush()
+
+    def finish(self) -> str:
+        self._write(self._cleaner.finish())
+        if self.first_line is None:
+            self.first_line = self._head
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        # Check if first line is a level-1 heading
+        filename = self.filename
+        if self.first_line.strip().startswith("# "):
+            heading = self.first_line[2:].strip()
+            if heading:  # ensure heading is not empty
+                filename = re.sub(r'[<>:"/\\|?*]', "", heading)
+
+        output_path = os.path.join(self.output_folder, f"{filename}.md")
+        if self.claim:
+            output_path = self.claim(output_path)
+        os.replace(self.part_path, output_path)
+        return output_path
+
+    def close(self):
+        """Stop writing and leave the partial output on disk."""
+        if not self._file.closed:
+            self._file.close()